@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Sauvegarde incrémentale du projet dans `Backup/store/` (remplace les ZIP complets).
+
+Chaque fichier est stocké une seule fois sous son empreinte SHA-256
+(`objects/ab/abcdef…`) ; un instantané n'est qu'un petit manifeste JSON
+compressé (`snapshots/<date>.json.gz`) qui associe chemin -> empreinte.
+Les fichiers dont la taille et la date n'ont pas changé depuis l'instantané
+précédent ne sont pas relus.
+
+Usage :
+    python gallery_backup.py snapshot            # nouvel instantané (si quelque chose a changé)
+    python gallery_backup.py list
+    python gallery_backup.py restore <snapshot> <dossier>
+    python gallery_backup.py prune [--daily N] [--weekly N]
+"""
+import os
+import sys
+import json
+import gzip
+import shutil
+import hashlib
+import datetime
+import argparse
+
+BACKUP_DIRNAME = 'Backup'
+STORE_DIRNAME = 'store'
+# Retention: keep the last snapshot of each of the last N days / N weeks
+KEEP_DAILY = 7
+KEEP_WEEKLY = 8
+# Never backed up: the backups themselves, regenerable caches and tooling folders
+EXCLUDE_DIRS = {BACKUP_DIRNAME, '__pycache__', '.venv', 'venv', '.thumbs', '.git'}
+EXCLUDE_FILES = {'.DS_Store'}
+EXCLUDE_EXT = ('.zip', '.pyc', '.gz', '.br')
+# Release folders of `generate_gallery.py --out` (.<name>.releases, see
+# gallery_publish.releases_dir()): copies of the generated site, new every build
+EXCLUDE_DIR_SUFFIX = '.releases'
+
+SNAPSHOT_FMT = '%Y-%m-%d_%H%M%S'
+
+
+def store_dir(root):
+    return os.path.join(root, BACKUP_DIRNAME, STORE_DIRNAME)
+
+
+def _object_path(root, digest):
+    return os.path.join(store_dir(root), 'objects', digest[:2], digest)
+
+
+def _hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _walk(root):
+    """Yield (rel, stat) for every file to back up, with one scandir per directory."""
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(root, rel_dir)) as it:
+            for entry in it:
+                rel = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in EXCLUDE_DIRS and not (
+                                entry.name.startswith('.') and entry.name.endswith(EXCLUDE_DIR_SUFFIX)):
+                            stack.append(rel)
+                    elif entry.is_file(follow_symlinks=False):
+                        if entry.name in EXCLUDE_FILES or entry.name.lower().endswith(EXCLUDE_EXT):
+                            continue
+                        if '.tmp' in entry.name:
+                            continue
+                        yield rel.replace('\\', '/'), entry.stat()
+                except OSError:
+                    continue
+
+
+def list_snapshots(root):
+    """Snapshot names, oldest first."""
+    snap_dir = os.path.join(store_dir(root), 'snapshots')
+    if not os.path.isdir(snap_dir):
+        return []
+    return sorted(fn[:-len('.json.gz')] for fn in os.listdir(snap_dir) if fn.endswith('.json.gz'))
+
+
+def load_snapshot(root, name):
+    with gzip.open(os.path.join(store_dir(root), 'snapshots', name + '.json.gz'), 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def snapshot(root):
+    """Record the current state of `root` in the store. Only files whose size or
+    mtime changed are hashed, only unknown contents are copied, and nothing is
+    written when nothing changed. Returns the snapshot name (or None)."""
+    names = list_snapshots(root)
+    previous = load_snapshot(root, names[-1])['files'] if names else {}
+    files = {}
+    added = 0
+    for rel, st in _walk(root):
+        old = previous.get(rel)
+        if old and old[1] == st.st_size and old[2] == st.st_mtime_ns:
+            files[rel] = old
+            continue
+        path = os.path.join(root, rel)
+        try:
+            digest = _hash_file(path)
+            obj = _object_path(root, digest)
+            if not os.path.exists(obj):
+                os.makedirs(os.path.dirname(obj), exist_ok=True)
+                tmp = f'{obj}.tmp{os.getpid()}'
+                shutil.copyfile(path, tmp)
+                os.replace(tmp, obj)
+                added += st.st_size
+        except OSError as e:
+            print('Backup: skipped', rel, e)
+            continue
+        files[rel] = [digest, st.st_size, st.st_mtime_ns]
+
+    if names and files == previous:
+        print('Backup unchanged (latest snapshot: %s)' % names[-1])
+        return None
+    name = datetime.datetime.now().strftime(SNAPSHOT_FMT)
+    if names and name <= names[-1]:
+        print('Backup skipped: a snapshot was already taken this second')
+        return None
+    path = os.path.join(store_dir(root), 'snapshots', name + '.json.gz')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+        json.dump({'created': name, 'files': files}, f, sort_keys=True, separators=(',', ':'))
+    os.replace(tmp, path)
+    print(f'Backup snapshot {name}: {len(files)} files, {added} new bytes stored')
+    return name
+
+
+def prune(root, daily=KEEP_DAILY, weekly=KEEP_WEEKLY):
+    """Apply the retention policy (latest snapshot of each of the last `daily`
+    days and `weekly` ISO weeks, plus the newest one) and delete the objects
+    no kept snapshot refers to."""
+    names = list_snapshots(root)
+    if not names:
+        return
+    keep = {names[-1]}
+    days, weeks = [], []
+    for name in reversed(names):
+        dt = datetime.datetime.strptime(name, SNAPSHOT_FMT)
+        day, week = dt.date(), dt.isocalendar()[:2]
+        if day not in days and len(days) < daily:
+            days.append(day)
+            keep.add(name)
+        if week not in weeks and len(weeks) < weekly:
+            weeks.append(week)
+            keep.add(name)
+    snap_dir = os.path.join(store_dir(root), 'snapshots')
+    for name in names:
+        if name not in keep:
+            os.remove(os.path.join(snap_dir, name + '.json.gz'))
+
+    live = set()
+    for name in keep:
+        live.update(entry[0] for entry in load_snapshot(root, name)['files'].values())
+    freed = 0
+    obj_root = os.path.join(store_dir(root), 'objects')
+    for sub in os.listdir(obj_root) if os.path.isdir(obj_root) else []:
+        for digest in os.listdir(os.path.join(obj_root, sub)):
+            if digest not in live:
+                path = os.path.join(obj_root, sub, digest)
+                freed += os.path.getsize(path)
+                os.remove(path)
+    removed = len(names) - len(keep)
+    if removed or freed:
+        print(f'Backup prune: removed {removed} snapshots, freed {freed} bytes')
+
+
+def restore(root, name, dest):
+    """Recreate snapshot `name` of `root` in directory `dest`."""
+    files = load_snapshot(root, name)['files']
+    for rel, (digest, size, mtime_ns) in sorted(files.items()):
+        out = os.path.join(dest, rel)
+        os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+        shutil.copyfile(_object_path(root, digest), out)
+        os.utime(out, ns=(mtime_ns, mtime_ns))
+    print(f'Restored {len(files)} files from {name} to {dest}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Incremental backups of the photo site.')
+    parser.add_argument('--root', default=os.path.expanduser('~/Desktop/MonSitePhotos'),
+                        help='project folder (default: ~/Desktop/MonSitePhotos)')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('snapshot', help='record a new snapshot if anything changed')
+    sub.add_parser('list', help='list snapshots')
+    p_restore = sub.add_parser('restore', help='restore a snapshot into a folder')
+    p_restore.add_argument('name')
+    p_restore.add_argument('dest')
+    p_prune = sub.add_parser('prune', help='apply the retention policy and delete unused objects')
+    p_prune.add_argument('--daily', type=int, default=KEEP_DAILY)
+    p_prune.add_argument('--weekly', type=int, default=KEEP_WEEKLY)
+    args = parser.parse_args()
+
+    if args.cmd == 'snapshot':
+        snapshot(args.root)
+    elif args.cmd == 'list':
+        for name in list_snapshots(args.root):
+            print(name)
+    elif args.cmd == 'restore':
+        if os.path.abspath(args.dest) == os.path.abspath(args.root):
+            sys.exit('Refusing to restore over the project itself; choose another folder.')
+        restore(args.root, args.name, args.dest)
+    elif args.cmd == 'prune':
+        prune(args.root, args.daily, args.weekly)
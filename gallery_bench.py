@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Banc d'essai de `generate_gallery.py` sur une photothèque synthétique.
+
+La photothèque est générée une fois selon un profil (nombre de groupes,
+d'images par groupe, tailles en mégapixels, mélange JPEG / PNG avec alpha /
+WebP / GIF, dossiers de miniatures) puis réutilisée tant que le profil ne
+change pas. Trois scénarios sont chronométrés de bout en bout, chacun dans un
+processus séparé avec `--profile` :
+
+    cold     cache des vignettes et pages supprimés
+    warm     aucune modification
+    change   une seule photo modifiée
+
+Les résultats (images/s, mémoire maximale, temps par étape) sont écrits en
+JSON ; `--compare` les confronte à une référence et sort en erreur en cas de
+régression, pour bloquer une version.
+
+Usage :
+    python gallery_bench.py --preset small
+    python gallery_bench.py --groups 10 --images 1000 --max-mp 50 --out bench.json
+    python gallery_bench.py --preset medium --compare bench-baseline.json
+"""
+import os
+import sys
+import json
+import time
+import glob
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GENERATOR = os.path.join(HERE, 'generate_gallery.py')
+SPEC_NAME = 'bench-library.json'
+
+# Library shapes: groups × images per group, source sizes in megapixels,
+# relative weights of the source formats and number of miniature overrides
+PRESETS = {
+    'small': {'groups': 3, 'images': 20, 'min_mp': 1, 'max_mp': 12, 'miniatures': 1},
+    'medium': {'groups': 10, 'images': 100, 'min_mp': 1, 'max_mp': 24, 'miniatures': 3},
+    'large': {'groups': 10, 'images': 1000, 'min_mp': 1, 'max_mp': 50, 'miniatures': 5},
+}
+FORMAT_WEIGHTS = {'jpg': 70, 'png_alpha': 10, 'webp': 15, 'gif': 5}
+ASPECTS = ((3, 2), (2, 3), (4, 3), (3, 4), (1, 1), (16, 9))
+# GIFs are palette images: keep them at web sizes
+GIF_MAX_MP = 2
+SCENARIOS = ('cold', 'warm', 'change')
+# Allowed slowdown / memory growth against the baseline before failing
+TOLERANCE = 0.10
+
+
+def _synth(size, rng):
+    """A photo-like RGB image: smooth gradients at low resolution, upscaled,
+    with full-resolution sensor-like noise so encoders have detail to keep."""
+    small = (max(8, size[0] // 16), max(8, size[1] // 16))
+    radial = Image.radial_gradient('L').resize(small)
+    linear = Image.linear_gradient('L').rotate(rng.randrange(360)).resize(small)
+    third = radial.rotate(rng.randrange(360))
+    base = Image.merge('RGB', (radial, linear, third)).resize(size, Image.BICUBIC)
+    noise = Image.effect_noise(size, rng.uniform(8, 40)).convert('RGB')
+    return Image.blend(base, noise, rng.uniform(0.05, 0.25))
+
+
+def _dimensions(rng, min_mp, max_mp):
+    aw, ah = rng.choice(ASPECTS)
+    mp = rng.uniform(min_mp, max_mp) * 1e6
+    unit = (mp / (aw * ah)) ** 0.5
+    return max(16, int(aw * unit)), max(16, int(ah * unit))
+
+
+def _save(path_stem, fmt, im):
+    if fmt == 'png_alpha':
+        im = im.convert('RGBA')
+        im.putalpha(Image.linear_gradient('L').resize(im.size))
+        path = path_stem + '.png'
+        im.save(path, compress_level=1)
+    elif fmt == 'webp':
+        path = path_stem + '.webp'
+        im.save(path, quality=85, method=0)
+    elif fmt == 'gif':
+        path = path_stem + '.gif'
+        im.convert('P', palette=Image.ADAPTIVE).save(path)
+    else:
+        path = path_stem + '.jpg'
+        im.save(path, quality=90)
+    return path
+
+
+def make_library(root, spec):
+    """Create the synthetic library described by `spec` in `root` (reused as is
+    when `root` already holds a library made from the same spec). Returns the
+    number of gallery images."""
+    spec_path = os.path.join(root, SPEC_NAME)
+    try:
+        with open(spec_path, encoding='utf-8') as f:
+            if json.load(f) == spec:
+                print('Reusing library', root)
+                return spec['groups'] * spec['images']
+    except (OSError, ValueError):
+        pass
+    if os.path.isdir(root):
+        shutil.rmtree(root)
+    rng = random.Random(spec['seed'])
+    formats = [f for f, w in FORMAT_WEIGHTS.items() for _ in range(w)]
+    started = time.perf_counter()
+    for g in range(spec['groups']):
+        group = os.path.join(root, 'images', f'Groupe{g:02d}')
+        os.makedirs(group)
+        for i in range(spec['images']):
+            fmt = rng.choice(formats)
+            max_mp = min(spec['max_mp'], GIF_MAX_MP) if fmt == 'gif' else spec['max_mp']
+            size = _dimensions(rng, min(spec['min_mp'], max_mp), max_mp)
+            _save(os.path.join(group, f'img{i:05d}'), fmt, _synth(size, rng))
+        print(f'Library: group {g + 1}/{spec["groups"]} written')
+    # miniature overrides, in both supported layouts
+    for g in range(min(spec['miniatures'], spec['groups'])):
+        name = f'groupe{g:02d}'
+        folder = f'miniature_{name}' if g % 2 == 0 else os.path.join('miniatures', name)
+        os.makedirs(os.path.join(root, 'images', folder))
+        _save(os.path.join(root, 'images', folder, 'cover'), 'jpg', _synth((1600, 1200), rng))
+    os.makedirs(os.path.join(root, 'images', 'profil'))
+    for name in ('a', 'b'):
+        _save(os.path.join(root, 'images', 'profil', name), 'jpg', _synth((2000, 3000), rng))
+    logo = os.path.join(HERE, 'logo_white.png')
+    if os.path.isfile(logo):
+        shutil.copyfile(logo, os.path.join(root, 'logo_white.png'))
+    with open(spec_path, 'w', encoding='utf-8') as f:
+        json.dump(spec, f, sort_keys=True)
+    print(f'Library written to {root} in {time.perf_counter() - started:.1f}s')
+    return spec['groups'] * spec['images']
+
+
+def clean_outputs(root):
+    """Remove everything a build writes, for a cold build."""
+    shutil.rmtree(os.path.join(root, 'images', '.thumbs'), ignore_errors=True)
+    shutil.rmtree(os.path.join(root, 'assets'), ignore_errors=True)
+    for pattern in ('*.html', '*.json', os.path.join('images', 'top_hero*')):
+        for path in glob.glob(os.path.join(root, pattern)):
+            if os.path.basename(path) != SPEC_NAME:
+                os.remove(path)
+
+
+def run_build(root, extra_args):
+    """Run one build in a fresh interpreter; returns (wall seconds, profile report)."""
+    fd, report_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    cmd = [sys.executable, GENERATOR, '--root', root, '--thumbs', '--no-backup',
+           '--profile', report_path] + list(extra_args)
+    try:
+        started = time.perf_counter()
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+        wall = time.perf_counter() - started
+        with open(report_path, encoding='utf-8') as f:
+            return wall, json.load(f)
+    finally:
+        os.remove(report_path)
+
+
+def _changed_image(root):
+    first = sorted(glob.glob(os.path.join(root, 'images', 'Groupe00', '*.jpg')))
+    return first[0] if first else None
+
+
+def run_scenario(name, root, images, extra_args):
+    """Prepare and time one scenario; returns its result entry."""
+    restore = None
+    if name == 'cold':
+        clean_outputs(root)
+    elif name == 'change':
+        path = _changed_image(root)
+        if path:
+            with open(path, 'rb') as f:
+                restore = (path, f.read(), os.stat(path))
+            with Image.open(path) as im:
+                im.rotate(180).save(path, quality=90)
+    try:
+        wall, report = run_build(root, extra_args)
+    finally:
+        if restore:
+            path, data, st = restore
+            with open(path, 'wb') as f:
+                f.write(data)
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    rss = report.get('peak_rss') or {}
+    counters = report.get('counters', {})
+    return {'wall': wall, 'images': images, 'images_per_s': images / wall if wall else None,
+            'thumbnails_generated': counters.get('thumbs.miss', 0),
+            'peak_rss': max(rss.values()) if rss else None,
+            'stages': {k: v['wall'] for k, v in report.get('stages', {}).items()},
+            'counters': counters}
+
+
+def _median_run(results):
+    """The run with the median wall time (all runs are kept in 'runs')."""
+    ordered = sorted(results, key=lambda r: r['wall'])
+    best = dict(ordered[len(ordered) // 2])
+    best['runs'] = [r['wall'] for r in results]
+    best['peak_rss'] = max((r['peak_rss'] or 0) for r in results) or None
+    return best
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Regressions of `results` against `baseline` (lists of messages)."""
+    problems = []
+    for name, cur in results['results'].items():
+        ref = baseline.get('results', {}).get(name)
+        if not ref:
+            continue
+        if ref.get('images_per_s') and cur['images_per_s'] < ref['images_per_s'] * (1 - tolerance):
+            problems.append(f'{name}: {cur["images_per_s"]:.1f} images/s, baseline '
+                            f'{ref["images_per_s"]:.1f}')
+        if ref.get('peak_rss') and cur['peak_rss'] and cur['peak_rss'] > ref['peak_rss'] * (1 + tolerance):
+            problems.append(f'{name}: peak RSS {cur["peak_rss"] / 2**20:.0f} MB, baseline '
+                            f'{ref["peak_rss"] / 2**20:.0f} MB')
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark generate_gallery.py on a synthetic library.')
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--groups', type=int, help='number of groups (overrides the preset)')
+    parser.add_argument('--images', type=int, help='images per group (overrides the preset)')
+    parser.add_argument('--min-mp', type=float, help='smallest source size in megapixels')
+    parser.add_argument('--max-mp', type=float, help='largest source size in megapixels')
+    parser.add_argument('--miniatures', type=int, help='groups with a miniature override folder')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--library', help='where to create the library (default: a folder in the temp dir)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help='comma-separated subset of ' + ', '.join(SCENARIOS))
+    parser.add_argument('--repeat', type=int, default=1, help='runs per scenario (the median is kept)')
+    parser.add_argument('--out', default='bench-results.json', help='JSON results file')
+    parser.add_argument('--compare', metavar='BASELINE', help='fail on regressions against this results file')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='allowed throughput loss / memory growth (default %(default)s)')
+    parser.add_argument('generator_args', nargs=argparse.REMAINDER,
+                        help='extra generate_gallery.py options, after --')
+    args = parser.parse_args(argv)
+
+    spec = dict(PRESETS[args.preset], seed=args.seed)
+    for key in ('groups', 'images', 'min_mp', 'max_mp', 'miniatures'):
+        if getattr(args, key) is not None:
+            spec[key] = getattr(args, key)
+    library = args.library or os.path.join(tempfile.gettempdir(), f'gallery-bench-{args.preset}')
+    extra = [a for a in args.generator_args if a != '--']
+    images = make_library(library, spec)
+
+    results = {'spec': spec, 'generator_args': extra,
+               'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                           'cpus': os.cpu_count()},
+               'results': {}}
+    for name in [s.strip() for s in args.scenarios.split(',') if s.strip()]:
+        if name not in SCENARIOS:
+            parser.error(f'unknown scenario {name!r}')
+        runs = []
+        for _ in range(max(1, args.repeat)):
+            if name != 'cold':
+                # warm and change builds start from an up-to-date site
+                run_build(library, extra)
+            runs.append(run_scenario(name, library, images, extra))
+        res = results['results'][name] = _median_run(runs)
+        rss = f'{res["peak_rss"] / 2**20:.0f} MB' if res['peak_rss'] else '?'
+        print(f'{name:>6}: {res["wall"]:8.2f}s  {res["images_per_s"]:8.1f} images/s  peak RSS {rss}')
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('Results written to', args.out)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for p in problems:
+            print('REGRESSION', p)
+        if problems:
+            sys.exit(1)
+        print('No regression against', args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Catalogue SQLite des métadonnées des photos (`images/.thumbs/catalog.sqlite`).
+
+Pour chaque fichier : dimensions, mode de couleur, transparence, orientation
+EXIF, date de prise de vue (DateTimeOriginal) et appareil. Seuls les en-têtes
+sont lus (Pillow ne décode pas les pixels), en parallèle, et uniquement pour
+les fichiers dont le chemin, la taille ou la date de modification ont changé
+depuis la mise à jour précédente. Le générateur s'en sert pour trier les
+groupes par date (--order date), redresser les vignettes selon l'orientation
+EXIF et connaître les dimensions sans rouvrir les fichiers.
+
+Usage seul :
+    python gallery_catalog.py [--root DOSSIER] update
+    python gallery_catalog.py [--root DOSSIER] query "camera LIKE '%X100%'"
+"""
+import os
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+CATALOG_NAME = 'catalog.sqlite'
+SCHEMA_VERSION = 1
+# EXIF tags
+TAG_ORIENTATION = 0x0112
+TAG_MODEL = 0x0110
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+COLUMNS = ('path', 'size', 'mtime_ns', 'width', 'height', 'mode', 'alpha', 'orientation', 'taken', 'camera')
+
+
+def connect(path):
+    """Open (and create or migrate) the catalog database."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+        conn.execute('DROP TABLE IF EXISTS photos')
+        conn.execute('''CREATE TABLE photos (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            width INTEGER,
+            height INTEGER,
+            mode TEXT,
+            alpha INTEGER,
+            orientation INTEGER,
+            taken TEXT,
+            camera TEXT)''')
+        conn.execute('CREATE INDEX photos_taken ON photos (taken)')
+        conn.execute('CREATE INDEX photos_camera ON photos (camera)')
+        conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        conn.commit()
+    return conn
+
+
+def read_header(root, rel):
+    """Metadata of one image from its header and EXIF block (no pixel decoding).
+    Dimensions are as stored; see display_size() for the oriented ones."""
+    with Image.open(os.path.join(root, rel)) as im:
+        info = {'width': im.size[0], 'height': im.size[1], 'mode': im.mode,
+                'alpha': int(im.mode in ('RGBA', 'LA', 'PA') or 'transparency' in im.info),
+                'orientation': 1, 'taken': None, 'camera': None}
+        try:
+            exif = im.getexif()
+        except Exception:
+            exif = None
+        if exif:
+            try:
+                info['orientation'] = int(exif.get(TAG_ORIENTATION) or 1)
+            except (TypeError, ValueError):
+                pass
+            taken = exif.get_ifd(TAG_EXIF_IFD).get(TAG_DATETIME_ORIGINAL) or exif.get(TAG_DATETIME)
+            if isinstance(taken, str) and taken.strip('\0 '):
+                # '2023:07:14 18:02:11' -> sortable '2023-07-14 18:02:11'
+                info['taken'] = taken.strip('\0 ').replace(':', '-', 2)
+            model = exif.get(TAG_MODEL)
+            if isinstance(model, str):
+                info['camera'] = model.strip('\0 ') or None
+    return info
+
+
+def _read_headers(root, rels):
+    out = []
+    for rel in rels:
+        try:
+            out.append((rel, read_header(root, rel)))
+        except Exception:
+            out.append((rel, None))
+    return out
+
+
+def update(conn, root, stats, jobs=0):
+    """Bring the catalog in line with `stats` ({rel: (size, mtime_ns)} of the
+    images, e.g. from the library scan): headers are read (on `jobs` worker
+    processes) only for new or modified files, rows of vanished files are
+    deleted. Returns the number of files read."""
+    known = {row[0]: (row[1], row[2]) for row in conn.execute('SELECT path, size, mtime_ns FROM photos')}
+    pending = [rel for rel, st in stats.items() if known.get(rel) != tuple(st[:2])]
+    gone = [(rel,) for rel in known if rel not in stats]
+    rows = []
+    if pending:
+        if jobs <= 0:
+            jobs = os.cpu_count() or 1
+        chunks = [pending[i:i + 64] for i in range(0, len(pending), 64)]
+        results = []
+        if jobs > 1 and len(chunks) > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=min(jobs, len(chunks))) as ex:
+                    for part in ex.map(_read_headers, [root] * len(chunks), chunks):
+                        results.extend(part)
+            except Exception as e:
+                print('Parallel metadata extraction failed, falling back to serial:', e)
+                results = []
+        if not results:
+            results = _read_headers(root, pending)
+        for rel, info in results:
+            info = info or {}
+            rows.append((rel, stats[rel][0], stats[rel][1], info.get('width'), info.get('height'),
+                         info.get('mode'), info.get('alpha'), info.get('orientation'),
+                         info.get('taken'), info.get('camera')))
+    with conn:
+        conn.executemany(f'INSERT OR REPLACE INTO photos ({", ".join(COLUMNS)}) '
+                         f'VALUES ({", ".join("?" * len(COLUMNS))})', rows)
+        conn.executemany('DELETE FROM photos WHERE path = ?', gone)
+    return len(pending)
+
+
+def load(conn, where=None, params=()):
+    """{path: row dict} of the catalogued photos (optionally filtered by an SQL
+    condition, e.g. "camera LIKE ?")."""
+    sql = f'SELECT {", ".join(COLUMNS)} FROM photos'
+    if where:
+        sql += f' WHERE {where}'
+    return {row[0]: dict(zip(COLUMNS, row)) for row in conn.execute(sql, params)}
+
+
+def display_size(row):
+    """(width, height) once the EXIF orientation is applied, or None."""
+    if not row or row.get('width') is None:
+        return None
+    if (row.get('orientation') or 1) in (5, 6, 7, 8):
+        return row['height'], row['width']
+    return row['width'], row['height']
+
+
+def by_date(paths, rows):
+    """paths ordered by capture date; undated photos follow, by name."""
+    return sorted(paths, key=lambda p: ((rows.get(p) or {}).get('taken') is None,
+                                        (rows.get(p) or {}).get('taken') or '', p))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Photo metadata catalog.')
+    parser.add_argument('--root', default=os.path.expanduser('~/Desktop/MonSitePhotos'),
+                        help='project folder (default: ~/Desktop/MonSitePhotos)')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('update', help='read the headers of new or modified images')
+    p_query = sub.add_parser('query', help='list photos matching an SQL condition')
+    p_query.add_argument('where', nargs='?')
+    args = parser.parse_args()
+
+    db = connect(os.path.join(args.root, 'images', '.thumbs', CATALOG_NAME))
+    if args.cmd == 'update':
+        exts = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+        stats = {}
+        for dirpath, dirnames, filenames in os.walk(os.path.join(args.root, 'images')):
+            dirnames[:] = [n for n in dirnames if not n.startswith('.')]
+            for fn in filenames:
+                if fn.lower().endswith(exts):
+                    st = os.stat(os.path.join(dirpath, fn))
+                    stats[os.path.relpath(os.path.join(dirpath, fn), args.root)] = (st.st_size, st.st_mtime_ns)
+        print(f'{update(db, args.root, stats)} files read, {len(stats)} catalogued')
+    else:
+        for path, row in sorted(load(db, args.where).items()):
+            print(path, row['taken'] or '-', row['camera'] or '-', display_size(row))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Mesures d'une génération pour `generate_gallery.py --profile`.
+
+Chaque étape (scan, vignettes, héros, pages, index, seed, sauvegarde…) est
+chronométrée en temps réel et en temps CPU ; les vignettes ajoutent leurs
+temps par image (ouverture, décodage, redimensionnement, encodage) mesurés
+dans les processus de travail. Le rapport JSON contient aussi les octets lus
+et écrits, les compteurs de cache (hit/miss) et la mémoire résidente maximale.
+
+Usage :
+    with gallery_profile.stage('index'):
+        write_index(groups)
+    gallery_profile.count('thumbs.hit')
+    gallery_profile.write('build-profile.json')
+"""
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_stages = {}
+_images = {}
+_counters = {}
+_started = None
+
+
+def reset():
+    """Forget everything measured so far (one report per build)."""
+    global _started
+    _stages.clear()
+    _images.clear()
+    _counters.clear()
+    _started = (time.perf_counter(), time.process_time())
+
+
+def _add(name, wall, cpu=None):
+    entry = _stages.setdefault(name, {'calls': 0, 'wall': 0.0})
+    entry['calls'] += 1
+    entry['wall'] += wall
+    if cpu is not None:
+        entry['cpu'] = entry.get('cpu', 0.0) + cpu
+
+
+@contextmanager
+def stage(name):
+    """Add the wall and CPU time of the block to stage `name`. The CPU time is
+    the parent's only: work done in a process pool shows up as wall time here
+    and per image in record_image()."""
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        _add(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+
+def count(name, n=1):
+    """Increment counter `name` (cache hits/misses, bytes read/written…)."""
+    _counters[name] = _counters.get(name, 0) + n
+
+
+def record_image(src, timing):
+    """Per-image timings of one thumbnail job ({'open', 'decode', 'resize',
+    'encode'} in seconds, plus 'read'/'written' in bytes). The phases are also
+    summed into the 'thumbs.<phase>' stages (time spent in the workers, so
+    without a 'cpu' figure and possibly more than the 'thumbs' wall time)."""
+    _images[src] = timing
+    for phase in ('open', 'decode', 'resize', 'encode'):
+        if phase in timing:
+            _add('thumbs.' + phase, timing[phase])
+    count('bytes.read', timing.get('read', 0))
+    count('bytes.written', timing.get('written', 0))
+
+
+def peak_rss():
+    """Peak resident set size in bytes of this process and of its (finished)
+    worker processes, or None where the resource module is missing."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return {'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+            'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit}
+
+
+def report():
+    """The build report as a JSON-serializable dict."""
+    total = None
+    if _started:
+        total = {'wall': time.perf_counter() - _started[0], 'cpu': time.process_time() - _started[1]}
+    return {'python': sys.version.split()[0], 'cpus': os.cpu_count(), 'total': total,
+            'stages': _stages, 'counters': _counters, 'peak_rss': peak_rss(), 'images': _images}
+
+
+def write(path):
+    """Write report() to `path` as JSON."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report(), f, indent=2, sort_keys=True)
+    print('Build profile written:', path)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Publication atomique du site généré dans un dossier de sortie (`--out`).
+
+`--out SITE` fait de SITE un lien symbolique vers une version complète du
+site rangée dans `.SITE.releases/<date>/`. Chaque publication prépare une
+nouvelle version à côté de l'ancienne (stage()) : elle démarre en liens
+physiques vers tous les fichiers de la version précédente, la génération y
+écrit directement ses pages et JSON (un fichier réécrit remplace son lien,
+l'ancienne version n'est jamais modifiée), puis publish() y lie les images
+du projet (originaux et vignettes) : lien physique vers le fichier source,
+clone (reflink) ou copie seulement s'il est sur un autre système de
+fichiers. Les fichiers que le site ne sert plus sont retirés, et le lien
+SITE est remplacé d'un seul rename(), si bien qu'un serveur web ne voit
+jamais de site à moitié écrit. La version précédente est gardée pour
+revenir en arrière.
+
+Usage seul (publie les fichiers listés sur l'entrée standard) :
+    python gallery_publish.py --root PROJET --out SITE < fichiers.txt
+"""
+import os
+import sys
+import shutil
+import datetime
+import argparse
+
+RELEASE_FMT = '%Y%m%d-%H%M%S-%f'
+# Releases kept next to the current one (for rollback)
+KEEP_PREVIOUS = 1
+# Linux FICLONE ioctl: copy-on-write clone (btrfs, XFS, …)
+FICLONE = 0x40049409
+
+
+def releases_dir(out):
+    out = os.path.abspath(out)
+    return os.path.join(os.path.dirname(out), f'.{os.path.basename(out)}.releases')
+
+
+def current_release(out):
+    """Path of the release `out` points to, or None."""
+    if not os.path.islink(out):
+        return None
+    target = os.path.join(os.path.dirname(os.path.abspath(out)), os.readlink(out))
+    return target if os.path.isdir(target) else None
+
+
+def _clone(src, dst):
+    """Copy src to dst (with its mtime), as a reflink when the filesystem can;
+    only used where a hardlink is impossible (another filesystem)."""
+    if sys.platform.startswith('linux'):
+        try:
+            import fcntl
+            with open(src, 'rb') as fi, open(dst, 'wb') as fo:
+                fcntl.ioctl(fo.fileno(), FICLONE, fi.fileno())
+            shutil.copystat(src, dst)
+            return
+        except (OSError, ImportError):
+            pass
+    shutil.copy2(src, dst)
+
+
+def _link(src, dst):
+    """Hardlink src as dst, or clone it when they are on different filesystems.
+    Returns True if it was linked."""
+    try:
+        os.link(src, dst)
+        return True
+    except OSError:
+        _clone(src, dst)
+        return False
+
+
+def stage(out):
+    """Create a new release directory for `out`, made of hardlinks to every
+    file of the current release, and return its path. Files written into it
+    must be replaced (os.replace()), never rewritten in place: the previous
+    release shares their inodes."""
+    out = os.path.abspath(out)
+    if os.path.exists(out) and not os.path.islink(out):
+        raise OSError(f'{out} exists and is not a symlink made by --out; refusing to replace it')
+    previous = current_release(out)
+    release = os.path.join(releases_dir(out), datetime.datetime.now().strftime(RELEASE_FMT))
+    os.makedirs(release)
+    for dirpath, dirnames, filenames in os.walk(previous) if previous else []:
+        target = os.path.join(release, os.path.relpath(dirpath, previous))
+        os.makedirs(target, exist_ok=True)
+        for fn in filenames:
+            _link(os.path.join(dirpath, fn), os.path.join(target, fn))
+    return release
+
+
+def publish(root, files, out, release=None, generated=(), keep=KEEP_PREVIOUS):
+    """Link `files` (paths relative to `root`) into `release` (a new stage()
+    when None), delete what is neither one of them nor `generated` (the files
+    written straight into the release), and point the `out` symlink at it
+    atomically. A file already in the release that is the source file, or
+    has its size and mtime, is kept. Returns the release path."""
+    out = os.path.abspath(out)
+    if release is None:
+        release = stage(out)
+    linked = copied = kept = 0
+    live = {os.path.normpath(rel) for rel in generated}
+    for rel in files:
+        src = os.path.join(root, rel)
+        dst = os.path.join(release, rel)
+        try:
+            st = os.stat(src)
+        except OSError:
+            continue
+        live.add(os.path.normpath(rel))
+        try:
+            ost = os.stat(dst)
+            if os.path.samestat(st, ost) or (ost.st_size == st.st_size and ost.st_mtime_ns == st.st_mtime_ns):
+                kept += 1
+                continue
+            os.remove(dst)
+        except OSError:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if _link(src, dst):
+            linked += 1
+        else:
+            copied += 1
+    removed = 0
+    for dirpath, dirnames, filenames in os.walk(release, topdown=False):
+        for fn in filenames:
+            path = os.path.join(dirpath, fn)
+            if os.path.relpath(path, release) not in live:
+                os.remove(path)
+                removed += 1
+        if dirpath != release and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+
+    # swap: a new symlink renamed over the old one
+    tmp = f'{out}.tmp{os.getpid()}'
+    os.symlink(os.path.relpath(release, os.path.dirname(out)), tmp, target_is_directory=True)
+    os.replace(tmp, out)
+    print(f'Published {out} -> {release} ({kept} unchanged, {linked} linked, '
+          f'{copied} copied, {removed} removed)')
+
+    base = releases_dir(out)
+    current = os.path.basename(release)
+    old = [name for name in sorted(os.listdir(base)) if name != current]
+    for name in old[:max(0, len(old) - keep)]:
+        shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+    return release
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Publish files of the project as an atomic release.')
+    parser.add_argument('--root', required=True, help='project folder the file paths are relative to')
+    parser.add_argument('--out', required=True, help='symlink to (re)point at the new release')
+    parser.add_argument('--keep', type=int, default=KEEP_PREVIOUS, help='previous releases to keep')
+    args = parser.parse_args()
+    publish(args.root, [l.strip() for l in sys.stdin if l.strip()], args.out, keep=args.keep)
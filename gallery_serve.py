@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Serveur de prévisualisation local et surveillance du dossier `images/`.
+
+Le serveur envoie ETag/Last-Modified (réponses 304), un Cache-Control
+`immutable` pour les fichiers empreintés de `assets/`, et gère les requêtes
+Range (206) pour que la vidéo de profil puisse être parcourue sans tout
+télécharger. Les fichiers précompressés (`.br`, `.gz`, voir --precompress)
+sont envoyés tels quels aux navigateurs qui les acceptent.
+
+La surveillance utilise inotify sous Linux et, ailleurs, un balayage
+os.scandir périodique ; les rafales de modifications sont regroupées.
+
+Usage seul :
+    python gallery_serve.py [--root DOSSIER] [--port 8000]
+"""
+import os
+import re
+import sys
+import time
+import select
+import struct
+import argparse
+import threading
+import ctypes
+import ctypes.util
+from functools import partial
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from email.utils import parsedate_to_datetime
+
+# Seconds without new events before a batch of changes is reported
+DEBOUNCE_SECONDS = 0.5
+# Interval of the scandir polling fallback
+POLL_SECONDS = 1.0
+# Fingerprinted files written by build_assets() (e.g. assets/site.3f9a1c0b2d.css)
+FINGERPRINTED = re.compile(r'(^|/)assets/[^/]+\.[0-9a-f]{10}\.[a-z0-9]+$')
+COPY_CHUNK = 64 * 1024
+# Precompressed siblings, in order of preference, and their Content-Encoding
+PRECOMPRESSED = (('.br', 'br'), ('.gz', 'gzip'))
+
+# inotify(7) constants
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+_EVENT = struct.Struct('iIII')
+
+
+class PreviewHandler(SimpleHTTPRequestHandler):
+    """Static file handler with validators, cache headers and byte ranges."""
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            return super().send_head()
+        encoding, sibling = self._precompressed(path)
+        try:
+            f = open(sibling or path, 'rb')
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+            return None
+        try:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            etag = f'"{size:x}-{st.st_mtime_ns:x}"'
+            rel = os.path.relpath(path, self.directory).replace(os.sep, '/')
+            if FINGERPRINTED.search(rel):
+                cache = 'public, max-age=31536000, immutable'
+            else:
+                cache = 'no-cache'
+
+            if self._not_modified(etag, st.st_mtime):
+                f.close()
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', cache)
+                if encoding is not None:
+                    self.send_header('Vary', 'Accept-Encoding')
+                self.end_headers()
+                return None
+
+            start, end = 0, size - 1
+            status = HTTPStatus.OK
+            rng = self.headers.get('Range')
+            if_range = self.headers.get('If-Range')
+            if rng and (not if_range or if_range == etag):
+                parsed = self._parse_range(rng, size)
+                if parsed is None:
+                    f.close()
+                    self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return None
+                start, end = parsed
+                status = HTTPStatus.PARTIAL_CONTENT
+
+            self.send_response(status)
+            self.send_header('Content-Type', self.guess_type(path))
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', self.date_time_string(st.st_mtime))
+            self.send_header('Cache-Control', cache)
+            if encoding is not None:
+                self.send_header('Vary', 'Accept-Encoding')
+                if sibling:
+                    self.send_header('Content-Encoding', encoding)
+            if status == HTTPStatus.PARTIAL_CONTENT:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.end_headers()
+            f.seek(start)
+            self._remaining = end - start + 1
+            return f
+        except Exception:
+            f.close()
+            raise
+
+    def _precompressed(self, path):
+        """(encoding, sibling path) of a .br/.gz copy of `path` the client
+        accepts, (None, None) if no sibling exists, or ('', None) when one exists
+        but is not used (so the response still varies on Accept-Encoding).
+        Range requests always get the identity bytes."""
+        found = [(ext, enc) for ext, enc in PRECOMPRESSED if os.path.isfile(path + ext)]
+        if not found:
+            return None, None
+        accepted = {t.split(';')[0].strip().lower()
+                    for t in self.headers.get('Accept-Encoding', '').split(',')}
+        if not self.headers.get('Range'):
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                for ext, enc in found:
+                    # a sibling older than the file is stale (site rebuilt without --precompress)
+                    if enc in accepted and os.stat(path + ext).st_mtime_ns >= mtime:
+                        return enc, path + ext
+            except OSError:
+                pass
+        return '', None
+
+    def _not_modified(self, etag, mtime):
+        inm = self.headers.get('If-None-Match')
+        if inm is not None:
+            return etag in [t.strip() for t in inm.split(',')] or inm.strip() == '*'
+        ims = self.headers.get('If-Modified-Since')
+        if ims:
+            try:
+                return int(mtime) <= parsedate_to_datetime(ims).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+        return False
+
+    @staticmethod
+    def _parse_range(header, size):
+        """(start, end) of a single 'bytes=' range, or None if unsatisfiable."""
+        m = re.fullmatch(r'\s*bytes=(\d*)-(\d*)\s*', header)
+        if not m or (not m.group(1) and not m.group(2)) or size == 0:
+            return None
+        if m.group(1):
+            start = int(m.group(1))
+            end = int(m.group(2)) if m.group(2) else size - 1
+        else:
+            start = max(0, size - int(m.group(2)))
+            end = size - 1
+        end = min(end, size - 1)
+        if start > end:
+            return None
+        return start, end
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, '_remaining', None)
+        try:
+            while remaining is None or remaining > 0:
+                block = source.read(COPY_CHUNK if remaining is None else min(COPY_CHUNK, remaining))
+                if not block:
+                    break
+                outputfile.write(block)
+                if remaining is not None:
+                    remaining -= len(block)
+        except (ConnectionError, BrokenPipeError):
+            # browsers drop video requests while seeking
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(root, port=8000, host='127.0.0.1'):
+    """Serve `root` on a background thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), partial(PreviewHandler, directory=root))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f'Preview: http://{host}:{server.server_address[1]}/gallery.html')
+    return server
+
+
+def _skipped(name, skip):
+    return name in skip or name.startswith('.')
+
+
+def _inotify_events(root, top, skip, timeout):
+    """Set up inotify watches on every directory below root/top and return a
+    generator of changed-path batches (empty when `timeout` elapsed quietly)."""
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    fd = libc.inotify_init1(IN_NONBLOCK)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+    wds = {}
+
+    def add_tree(rel):
+        for dirpath, dirnames, _ in os.walk(os.path.join(root, rel)):
+            dirnames[:] = [n for n in dirnames if not _skipped(n, skip)]
+            wd = libc.inotify_add_watch(fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd >= 0:
+                wds[wd] = os.path.relpath(dirpath, root)
+
+    add_tree(top)
+
+    def events():
+        try:
+            while True:
+                ready, _, _ = select.select([fd], [], [], timeout)
+                changed = set()
+                if ready:
+                    try:
+                        data = os.read(fd, 64 * 1024)
+                    except BlockingIOError:
+                        data = b''
+                    pos = 0
+                    while pos + _EVENT.size <= len(data):
+                        wd, mask, _cookie, length = _EVENT.unpack_from(data, pos)
+                        name = data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b'\0')
+                        pos += _EVENT.size + length
+                        if mask & IN_Q_OVERFLOW:
+                            changed.add(top)
+                            continue
+                        base = wds.get(wd)
+                        if base is None:
+                            continue
+                        if mask & IN_IGNORED:
+                            wds.pop(wd, None)
+                            continue
+                        name = os.fsdecode(name)
+                        if name and _skipped(name, skip):
+                            continue
+                        path = os.path.join(base, name) if name else base
+                        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                            add_tree(path)
+                        changed.add(path)
+                yield changed
+        finally:
+            os.close(fd)
+
+    return events()
+
+
+def _scan_state(root, top, skip):
+    """{rel: (size, mtime_ns)} of every file and directory below root/top."""
+    state = {}
+    stack = [top]
+    while stack:
+        rel = stack.pop()
+        try:
+            with os.scandir(os.path.join(root, rel)) as it:
+                for entry in it:
+                    if _skipped(entry.name, skip):
+                        continue
+                    path = os.path.join(rel, entry.name)
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    state[path] = (st.st_size, st.st_mtime_ns)
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(path)
+        except OSError:
+            continue
+    return state
+
+
+def _poll_events(root, top, skip, interval):
+    state = _scan_state(root, top, skip)
+    while True:
+        time.sleep(interval)
+        new = _scan_state(root, top, skip)
+        yield {p for p in new.keys() | state.keys() if new.get(p) != state.get(p)}
+        state = new
+
+
+def watch(root, top='images', skip=('.thumbs',), debounce=DEBOUNCE_SECONDS, poll=POLL_SECONDS):
+    """Yield sets of changed paths (relative to root) below root/top, once no
+    new change arrived for `debounce` seconds. Uses inotify when available,
+    otherwise polls with os.scandir every `poll` seconds."""
+    try:
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is only available on Linux')
+        events = _inotify_events(root, top, set(skip), debounce)
+        print('Watching', os.path.join(root, top), '(inotify)')
+    except (OSError, AttributeError):
+        events = _poll_events(root, top, set(skip), poll)
+        print('Watching', os.path.join(root, top), f'(polling every {poll}s)')
+    pending = set()
+    last = 0.0
+    for batch in events:
+        if batch:
+            pending |= batch
+            last = time.monotonic()
+        elif pending and time.monotonic() - last >= debounce:
+            yield pending
+            pending = set()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the generated site locally.')
+    parser.add_argument('--root', default=os.path.expanduser('~/Desktop/MonSitePhotos'))
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    start_server(args.root, args.port)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
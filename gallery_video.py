@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Préparation des vidéos de profil en pur Python (aucun outil externe).
+
+Un MP4/MOV est une suite d'atomes : `ftyp`, `mdat` (les données audio et
+vidéo), `moov` (l'index : pistes, durée, position de chaque morceau dans
+`mdat`)… Quand `moov` est placé après `mdat`, le navigateur doit télécharger
+presque tout le fichier avant de pouvoir lancer la lecture. faststart()
+réécrit le fichier avec `moov` devant `mdat`, comme `qt-faststart` : seul
+`moov` est chargé en mémoire, ses tables de positions (`stco`/`co64`) sont
+décalées, et tout le reste est recopié par blocs de COPY_CHUNK octets.
+
+probe() lit les en-têtes (fast-start ou non, dimensions, durée) et
+cover_art() la pochette intégrée (`covr`), utilisée comme affiche (poster).
+
+Usage seul :
+    python gallery_video.py info clip.mp4
+    python gallery_video.py faststart clip.mp4 clip-faststart.mp4
+    python gallery_video.py selftest
+"""
+import os
+import struct
+import argparse
+import tempfile
+
+# Containers walked to reach the chunk offset tables (moov/trak/mdia/minf/stbl/stco)
+OFFSET_PATH = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+# Containers walked to reach the cover art (moov/udta/meta/ilst/covr/data)
+COVER_PATH = {b'moov', b'udta', b'meta', b'ilst', b'covr'}
+# Top-level atoms a MP4/QuickTime file may start with
+TOP_LEVEL = {b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot', b'uuid', b'pdin', b'styp'}
+COPY_CHUNK = 1 << 20
+# A larger moov is not loaded in memory (real ones are a few MB at most)
+MAX_MOOV = 64 << 20
+# 'data' type indicators of the cover art
+COVER_TYPES = {13: '.jpg', 14: '.png', 27: '.bmp'}
+
+
+def top_level_atoms(f):
+    """[(type, offset, size, header size)] of the top-level atoms of an open
+    file, reading headers only."""
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    atoms, pos = [], 0
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack('>I4s', f.read(8))
+        head = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            head = 16
+        elif size == 0:
+            size = end - pos
+        if not atoms and kind not in TOP_LEVEL:
+            raise ValueError('not a MP4/QuickTime file')
+        if size < head or pos + size > end:
+            raise ValueError(f'invalid {kind.decode("latin-1")!r} atom at offset {pos}')
+        atoms.append((kind, pos, size, head))
+        pos += size
+    return atoms
+
+
+def _parse(buf, walk):
+    """Atoms of `buf` as [type, data, children] nodes; only the types in `walk`
+    are split into children, other payloads stay raw bytes. Trailing bytes too
+    short for an atom are kept as a [None, bytes, None] node."""
+    nodes, i = [], 0
+    while i + 8 <= len(buf):
+        size, kind = struct.unpack('>I4s', buf[i:i + 8])
+        head = 8
+        if size == 1:
+            size = struct.unpack('>Q', buf[i + 8:i + 16])[0]
+            head = 16
+        elif size == 0:
+            size = len(buf) - i
+        if size < head or i + size > len(buf):
+            raise ValueError(f'invalid {kind.decode("latin-1")!r} atom')
+        payload = buf[i + head:i + size]
+        if kind in walk:
+            # 'meta' is a full box in MP4 (version/flags before the children), not in QuickTime
+            skip = 4 if kind == b'meta' and payload[8:12] == b'hdlr' else 0
+            nodes.append([kind, payload[:skip], _parse(payload[skip:], walk)])
+        else:
+            nodes.append([kind, payload, None])
+        i += size
+    if i < len(buf):
+        nodes.append([None, buf[i:], None])
+    return nodes
+
+
+def _serialize(nodes):
+    out = []
+    for kind, data, children in nodes:
+        if kind is None:
+            out.append(data)
+            continue
+        body = data + (_serialize(children) if children is not None else b'')
+        if len(body) + 8 > 0xFFFFFFFF:
+            out.append(struct.pack('>I4sQ', 1, kind, len(body) + 16))
+        else:
+            out.append(struct.pack('>I4s', len(body) + 8, kind))
+        out.append(body)
+    return b''.join(out)
+
+
+def _find(nodes, kind):
+    """Every node of type `kind` in the tree, depth first."""
+    for node in nodes:
+        if node[0] == kind:
+            yield node
+        if node[2] is not None:
+            yield from _find(node[2], kind)
+
+
+def _shift_offsets(nodes, shifts):
+    """Add `delta` to the chunk offsets in [start, end) for each (start, end,
+    delta) of `shifts`; a 32-bit table (stco) that would overflow becomes a
+    64-bit one (co64)."""
+    def shift(o):
+        for start, end, delta in shifts:
+            if start <= o < end:
+                return o + delta
+        return o
+    for node in list(_find(nodes, b'stco')) + list(_find(nodes, b'co64')):
+        kind, data = node[0], node[1]
+        count = struct.unpack('>I', data[4:8])[0]
+        fmt = 'I' if kind == b'stco' else 'Q'
+        offsets = struct.unpack(f'>{count}{fmt}', data[8:8 + count * struct.calcsize(fmt)])
+        offsets = [shift(o) for o in offsets]
+        if kind == b'stco' and offsets and max(offsets) > 0xFFFFFFFF:
+            node[0], fmt = b'co64', 'Q'
+        node[1] = data[:8] + struct.pack(f'>{count}{fmt}', *offsets)
+
+
+def _read_moov(f, atoms):
+    moov = [a for a in atoms if a[0] == b'moov']
+    if not moov:
+        raise ValueError('no moov atom')
+    kind, pos, size, head = moov[0]
+    if size > MAX_MOOV:
+        raise ValueError(f'moov atom too large ({size} bytes)')
+    f.seek(pos + head)
+    return moov[0], f.read(size - head)
+
+
+def probe(path):
+    """Header information of a video: {'faststart', 'width', 'height',
+    'duration' (seconds), 'brand'}. Raises ValueError if it is not a readable
+    MP4/QuickTime file."""
+    with open(path, 'rb') as f:
+        atoms = top_level_atoms(f)
+        (_, moov_pos, _, _), payload = _read_moov(f, atoms)
+        brand = None
+        if atoms[0][0] == b'ftyp':
+            f.seek(atoms[0][1] + atoms[0][3])
+            brand = f.read(4).decode('latin-1').strip() or None
+    mdat = [a[1] for a in atoms if a[0] == b'mdat']
+    info = {'faststart': not mdat or moov_pos < mdat[0], 'width': None, 'height': None,
+            'duration': None, 'brand': brand}
+    tree = _parse(payload, OFFSET_PATH)
+    if any(True for _ in _find(tree, b'cmov')):
+        raise ValueError('compressed moov atom')
+    for kind, data, _ in _find(tree, b'mvhd'):
+        if data[0] == 1:
+            scale, duration = struct.unpack('>IQ', data[20:32])
+        else:
+            scale, duration = struct.unpack('>II', data[12:20])
+        if scale:
+            info['duration'] = round(duration / scale, 3)
+    for kind, data, _ in _find(tree, b'tkhd'):
+        # track width and height: the last 8 bytes, 16.16 fixed point
+        w, h = struct.unpack('>II', data[-8:])
+        if w and h and not info['width']:
+            info['width'], info['height'] = w >> 16, h >> 16
+    return info
+
+
+def cover_art(path):
+    """(bytes, extension) of the cover art embedded in the video's metadata
+    (moov/udta/meta/ilst/covr), or None."""
+    with open(path, 'rb') as f:
+        _, payload = _read_moov(f, top_level_atoms(f))
+    for covr in _find(_parse(payload, COVER_PATH), b'covr'):
+        for kind, data, _ in covr[2] or []:
+            if kind == b'data' and len(data) > 8:
+                ext = COVER_TYPES.get(struct.unpack('>I', data[:4])[0] & 0xFFFFFF)
+                if ext:
+                    return data[8:], ext
+    return None
+
+
+def _copy_range(fi, fo, start, length):
+    fi.seek(start)
+    while length > 0:
+        block = fi.read(min(COPY_CHUNK, length))
+        if not block:
+            raise ValueError('unexpected end of file')
+        fo.write(block)
+        length -= len(block)
+
+
+def faststart(src, dst):
+    """Write `src` to `dst` with its moov atom moved in front of the media data
+    and the chunk offsets patched accordingly; memory use is bounded by the
+    moov size plus COPY_CHUNK. Returns False (writing nothing) when `src` is
+    already fast-start."""
+    with open(src, 'rb') as fi:
+        atoms = top_level_atoms(fi)
+        (_, moov_pos, moov_size, _), payload = _read_moov(fi, atoms)
+        mdat = [a[1] for a in atoms if a[0] == b'mdat']
+        if not mdat or moov_pos < mdat[0]:
+            return False
+        insert_at = mdat[0]
+        fi.seek(0, os.SEEK_END)
+        end = fi.tell()
+        # the moved moov shifts the data between insert_at and its old place by
+        # its new size, and the data after its old place (a second mdat…) by
+        # the growth only; it grows if a stco table has to become co64:
+        # iterate until stable
+        delta = moov_size
+        while True:
+            tree = _parse(payload, OFFSET_PATH)
+            if any(True for _ in _find(tree, b'cmov')):
+                raise ValueError('compressed moov atom')
+            moov = [[b'moov', b'', tree]]
+            _shift_offsets(tree, [(insert_at, moov_pos, delta),
+                                  (moov_pos + moov_size, end, delta - moov_size)])
+            data = _serialize(moov)
+            if len(data) == delta:
+                break
+            delta = len(data)
+        tmp = f'{dst}.tmp{os.getpid()}'
+        try:
+            with open(tmp, 'wb') as fo:
+                _copy_range(fi, fo, 0, insert_at)
+                fo.write(data)
+                _copy_range(fi, fo, insert_at, moov_pos - insert_at)
+                _copy_range(fi, fo, moov_pos + moov_size, end - moov_pos - moov_size)
+            os.replace(tmp, dst)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    return True
+
+
+def _chunk_offsets(path):
+    """Chunk offsets of every stco/co64 table of a file, in order."""
+    with open(path, 'rb') as f:
+        _, payload = _read_moov(f, top_level_atoms(f))
+    tree = _parse(payload, OFFSET_PATH)
+    offsets = []
+    for node in list(_find(tree, b'stco')) + list(_find(tree, b'co64')):
+        count = struct.unpack('>I', node[1][4:8])[0]
+        fmt = 'I' if node[0] == b'stco' else 'Q'
+        offsets += struct.unpack(f'>{count}{fmt}', node[1][8:8 + count * struct.calcsize(fmt)])
+    return offsets
+
+
+def selftest():
+    """Rewrite synthetic files (ftyp, mdat, moov[, free, mdat]) fast-start and
+    check that every chunk offset still points at the same bytes. Returns the
+    failures (empty when everything passed)."""
+    def atom(kind, body):
+        return struct.pack('>I4s', len(body) + 8, kind) + body
+
+    failures = []
+    for tail in ([], [b'mdat'], [b'free', b'mdat']):
+        chunks = [b'first-chunk-of-mdat-1', b'second-chunk-mdat-1'] + [b'chunk-of-%s' % k for k in tail]
+        ftyp = atom(b'ftyp', b'isom\0\0\0\x01isom')
+        mdat = atom(b'mdat', chunks[0] + chunks[1])
+        # first pass with placeholder offsets, to know where the moov ends
+        offsets = [len(ftyp) + 8, len(ftyp) + 8 + len(chunks[0])]
+
+        def moov(offs):
+            stco = atom(b'stco', struct.pack(f'>II{len(offs)}I', 0, len(offs), *offs))
+            return atom(b'moov', atom(b'trak', atom(b'mdia', atom(b'minf', atom(b'stbl', stco)))))
+        pos = len(ftyp) + len(mdat) + len(moov(offsets + [0] * len(tail)))
+        rest = b''
+        for kind, chunk in zip(tail, chunks[2:]):
+            offsets.append(pos + len(rest) + 8)
+            rest += atom(kind, chunk)
+        src_bytes = ftyp + mdat + moov(offsets) + rest
+        with tempfile.TemporaryDirectory() as tmp:
+            src, dst = os.path.join(tmp, 'in.mp4'), os.path.join(tmp, 'out.mp4')
+            with open(src, 'wb') as f:
+                f.write(src_bytes)
+            layout = '/'.join(['ftyp', 'mdat', 'moov'] + [k.decode() for k in tail])
+            if not faststart(src, dst):
+                failures.append(f'{layout}: not rewritten')
+                continue
+            with open(dst, 'rb') as f:
+                out = f.read()
+            with open(dst, 'rb') as f:
+                kinds = [a[0] for a in top_level_atoms(f)]
+            if kinds.index(b'moov') > kinds.index(b'mdat'):
+                failures.append(f'{layout}: moov still after mdat')
+            for chunk, off in zip(chunks, _chunk_offsets(dst)):
+                if out[off:off + len(chunk)] != chunk:
+                    failures.append(f'{layout}: chunk {chunk!r} not found at offset {off}')
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect MP4/MOV files and rewrite them fast-start.')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_info = sub.add_parser('info', help='print the layout and header information of videos')
+    p_info.add_argument('videos', nargs='+')
+    p_fast = sub.add_parser('faststart', help='write a copy with the moov atom first')
+    p_fast.add_argument('src')
+    p_fast.add_argument('dst')
+    sub.add_parser('selftest', help='check faststart() on synthetic files, one or two mdat atoms')
+    args = parser.parse_args()
+
+    if args.cmd == 'info':
+        for path in args.videos:
+            try:
+                with open(path, 'rb') as f:
+                    layout = ' '.join(f'{k.decode("latin-1")}({s})' for k, _, s, _ in top_level_atoms(f))
+                print(path, probe(path), layout)
+            except (OSError, ValueError) as e:
+                print(path, 'error:', e)
+    elif args.cmd == 'selftest':
+        failures = selftest()
+        for failure in failures:
+            print('FAIL', failure)
+        print('selftest:', 'failed' if failures else 'ok')
+        raise SystemExit(1 if failures else 0)
+    elif faststart(args.src, args.dst):
+        print('Wrote', args.dst)
+    else:
+        print(args.src, 'is already fast-start; nothing written')
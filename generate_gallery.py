@@ -2,116 +2,969 @@ import os
 from pathlib import Path
 import html
 import time
-import subprocess
-import datetime
-import shutil
 import json
+import base64
+import re
+import io
+import hashlib
+import gzip
+import math
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import gallery_backup
+import gallery_catalog
+import gallery_profile
+import gallery_publish
+import gallery_serve
+import gallery_video
 
 
 # Project root and images folder
 d = os.path.expanduser('~/Desktop/MonSitePhotos')
 imgdir = os.path.join(d, 'images')
+# Where the pages, JSON and assets are written: the project root, or with
+# --out the release being staged (see build())
+site_dir = d
 
 # Pillow for thumbnails
 try:
     from PIL import Image
     PIL_AVAILABLE = True
+    _T = getattr(Image, 'Transpose', Image)
+    # EXIF orientation -> transpose() turning the stored pixels upright
+    EXIF_TRANSPOSE = {2: _T.FLIP_LEFT_RIGHT, 3: _T.ROTATE_180, 4: _T.FLIP_TOP_BOTTOM,
+                      5: _T.TRANSPOSE, 6: _T.ROTATE_270, 7: _T.TRANSVERSE, 8: _T.ROTATE_90}
 except Exception:
     PIL_AVAILABLE = False
+    EXIF_TRANSPOSE = {}
+
+# Optional encoders of the precompressed .gz/.br siblings (--precompress)
+try:
+    import zopfli.gzip as zopfli_gzip
+except Exception:
+    zopfli_gzip = None
+try:
+    import brotli
+except Exception:
+    try:
+        import brotlicffi as brotli
+    except Exception:
+        brotli = None
+
+# NumPy for the perceptual (SSIM) quality search
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except Exception:
+    NUMPY_AVAILABLE = False
 
 valid_ext = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+VIDEO_EXT = ('.mp4', '.webm', '.mov', '.m4v', '.ogg')
+VIDEO_TYPES = {'.mp4': 'video/mp4', '.m4v': 'video/mp4', '.webm': 'video/webm', '.ogg': 'video/ogg'}
+# Fast-start copies and posters of the profile videos, in images/.thumbs/<VIDEO_DIRNAME>
+VIDEO_DIRNAME = 'video'
+POSTER_MAX_WIDTH = 1280
 # Bigger thumbnails: change this to adjust thumbnail pixel size
 # Increased so regenerated thumbnails are larger for the gallery display
 THUMB_MAX_SIZE = (2400, 1800)
 THUMB_DIRNAME = '.thumbs'
+# Widths of the smaller copies written next to each thumbnail (used for srcset)
+THUMB_WIDTHS = (320, 640, 1024, 1600)
+# Narrower rungs are written to a per-width folder next to the largest one
+# (images/.thumbs/<dir>/.320w/<stem>.jpg): hidden folders are never scanned for
+# sources, so no source name can collide with a rung
+RUNG_DIRNAME = '.{}w'
+# `sizes` hints: group tiles are 420px wide, index covers fill half of the 1100px column
+GROUP_IMG_SIZES = '(max-width: 460px) calc(100vw - 40px), 420px'
+COVER_IMG_SIZES = '(max-width: 900px) calc(100vw - 40px), 530px'
+# Combined top hero on the index: height, srcset widths and encoder settings
+HERO_HEIGHT = 720
+HERO_WIDTHS = (640, 960, 1280)
+HERO_JPEG_SAVE = {'quality': 100, 'optimize': True, 'progressive': True, 'subsampling': 0}
+HERO_WEBP_SAVE = {'quality': 100, 'method': 6}
+HERO_IMG_SIZES = '(max-width: 1400px) 100vw, 1400px'
+# Group pages: 'single' (every image on one page), 'paged' or 'virtual'
+GROUP_MODE = 'single'
+# Images per page in 'paged' mode (and in the <noscript> fallback of 'virtual')
+GROUP_PAGE_SIZE = 60
+# Embed a tiny blurred placeholder (LQIP) as background of each tile
+LQIP = False
+LQIP_WIDTH = 16
 # Toggle thumbnail generation. Set to False to always use original images in galleries.
 USE_THUMBS = False
+# Encoder settings for thumbnails (part of the manifest key)
+JPEG_SAVE = {'quality': 100, 'optimize': True, 'progressive': True, 'subsampling': 0}
+WEBP_SAVE = {'quality': 95, 'method': 6}
+# 'max': always encode with JPEG_SAVE/WEBP_SAVE; 'ssim': per derivative, the
+# lowest quality in QUALITY_RANGE whose SSIM to the rung is >= TARGET_SSIM
+ENCODER = 'max'
+TARGET_SSIM = 0.985
+QUALITY_RANGE = (40, 95)
+SEARCH_JPEG_SAVE = {'optimize': True, 'progressive': True}
+SEARCH_WEBP_SAVE = {'method': 4}
+# Longest side of the image the quality search runs on, and weight of the Y, Cb, Cr planes
+SSIM_SIZE = 768
+SSIM_WEIGHTS = (0.8, 0.1, 0.1)
+# Build manifest in images/.thumbs: source identity + settings -> derivatives
+# localstorage_seed.json: inline previews (longest side, quality) kept under
+# SEED_BUDGET bytes of JSON, below the ~5 MB localStorage quota of browsers
+SEED_NAME = 'localstorage_seed.json'
+SEED_BUDGET = 4 * 1024 * 1024
+SEED_MAX_DIM = 480
+SEED_QUALITY = 60
+SEED_DIRNAME = 'seed'
+# Stop adding entries once less room than this is left
+SEED_MIN_ENTRY = 2048
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+# Persisted library scan (directory listings), see scan_library()
+LIBRARY_CACHE = 'library.json'
+# Minify the written pages and JSON; write .gz/.br siblings of the served files
+MINIFY = False
+PRECOMPRESS = False
+# Inline the CSS rules the top of each page needs and load the stylesheet
+# without blocking the first render
+CRITICAL_CSS = True
+# Fixed chrome written at the end of the pages, below the fold but on screen
+# from the first paint: its rules are inlined with the critical CSS
+CRITICAL_CHROME = ('bottom-bar', 'video-modal', 'video-wrap', 'video-close')
+# Images in the first row of a group page (and covers in the first row of the
+# index): loaded eagerly, and prefetched from the index on hover
+FIRST_ROW = 2
+# Also compare content hashes (not only size/mtime) to detect changed sources
+HASH_SOURCES = False
+# Share the derivatives and URL of byte-identical sources and report near
+# duplicates: dHashes within NEAR_DUP_BITS bits (LSH over DHASH_BANDS bands)
+DEDUP = False
+NEAR_DUP_BITS = 6
+DHASH_BANDS = 8
+DUPLICATES_REPORT = 'duplicates.json'
+# Order of the photos in a group: 'name' (file name) or 'date' (EXIF capture
+# date from the metadata catalog, undated photos last)
+ORDER = 'name'
+# Number of worker processes for thumbnail generation (0 = one per CPU, 1 = serial)
+JOBS = 0
+# Peak memory (MB) the thumbnail workers may use together for decoding (0 = no limit)
+MEMORY_BUDGET_MB = 2048
+
+# src_rel -> thumbnail rel path, filled by generate_thumbs() before pages are written
+_thumbs = {}
+_library = None
+# Non-canonical copy -> canonical source (filled by find_duplicates())
+_canonical = {}
+# Catalog rows of the images ({rel: {'width', 'height', 'orientation', 'taken', …}})
+_catalog = {}
+# Content hashes of this build ({rel: ((size, mtime_ns), sha1)}), see source_stamp()
+_digests = {}
+_manifest = {'version': MANIFEST_VERSION, 'sources': {}, 'stages': {}}
 
 def slug(name: str) -> str:
     s = ''.join(c if c.isalnum() else '_' for c in name).strip('_')
     return s.lower() or 'group'
 
+def _file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def source_stamp(src_rel):
+    """Identity of a source file as recorded in the manifest: size, mtime and,
+    when HASH_SOURCES is set, a content hash."""
+    src_path = Path(d) / src_rel
+    cached = _library['stats'].get(src_rel) if _library else None
+    if cached:
+        stamp = {'size': cached[0], 'mtime_ns': cached[1]}
+    else:
+        st = src_path.stat()
+        stamp = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if HASH_SOURCES:
+        # hashed once per build: every stage asks for the stamp of the same sources
+        key = (stamp['size'], stamp['mtime_ns'])
+        known = _digests.get(src_rel)
+        if not known or known[0] != key:
+            known = _digests[src_rel] = (key, _file_sha1(src_path))
+        stamp['sha1'] = known[1]
+    return stamp
+
+
+def thumb_settings():
+    """Encoder settings that affect thumbnail bytes; a change invalidates the cache."""
+    if ENCODER == 'ssim':
+        return {'max_size': list(THUMB_MAX_SIZE), 'widths': sorted(THUMB_WIDTHS), 'rungs': RUNG_DIRNAME,
+                'encoder': 'ssim',
+                'ssim': TARGET_SSIM, 'range': list(QUALITY_RANGE), 'ssim_size': SSIM_SIZE,
+                'jpeg': SEARCH_JPEG_SAVE, 'webp': SEARCH_WEBP_SAVE}
+    return {'max_size': list(THUMB_MAX_SIZE), 'widths': sorted(THUMB_WIDTHS), 'rungs': RUNG_DIRNAME,
+            'jpeg': JPEG_SAVE, 'webp': WEBP_SAVE}
+
+
+def load_manifest():
+    """Load the build manifest from images/.thumbs (empty one if missing or unreadable)."""
+    global _manifest
+    path = os.path.join(imgdir, THUMB_DIRNAME, MANIFEST_NAME)
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != MANIFEST_VERSION:
+            raise ValueError('manifest version mismatch')
+    except Exception:
+        data = {'version': MANIFEST_VERSION}
+    data.setdefault('sources', {})
+    data.setdefault('stages', {})
+    _manifest = data
+    return _manifest
+
+
+def save_manifest():
+    path = os.path.join(imgdir, THUMB_DIRNAME, MANIFEST_NAME)
+    write_text_if_changed(path, json.dumps(_manifest, ensure_ascii=False, sort_keys=True))
+
+
+def write_text_if_changed(path, text):
+    """Write text to path unless the file already holds exactly this content.
+    The file is replaced atomically. Returns True if it was written."""
+    data = text.encode('utf-8')
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                gallery_profile.count('files.unchanged')
+                return False
+    except OSError:
+        pass
+    gallery_profile.count('files.written')
+    gallery_profile.count('bytes.written', len(data))
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.tmp{os.getpid()}'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
+
+
+def stage_is_fresh(name, key):
+    """True if stage `name` last ran with the same key and all its outputs still exist."""
+    entry = _manifest.get('stages', {}).get(name)
+    fresh = bool(entry) and entry.get('key') == key and all((Path(d) / o).exists()
+                                                            for o in entry.get('outputs', []))
+    gallery_profile.count(f'{name}.hit' if fresh else f'{name}.miss')
+    return fresh
+
+
+def record_stage(name, key, outputs, **extra):
+    _manifest.setdefault('stages', {})[name] = {'key': key, 'outputs': list(outputs), **extra}
+
+
+def stage_entry(name):
+    """What record_stage() stored for stage `name` ({} if it never ran)."""
+    return _manifest.get('stages', {}).get(name) or {}
+
+
+def cached_thumb(src_rel, stamp):
+    """Thumbnail path recorded in the manifest for this exact source and settings, or None."""
+    entry = _manifest.get('sources', {}).get(src_rel)
+    if not entry or entry.get('stamp') != stamp or entry.get('settings') != thumb_settings():
+        return None
+    if entry.get('orientation', 1) != orientation_of(src_rel):
+        return None
+    if not all((Path(d) / o).exists() for o in entry.get('outputs', [])):
+        return None
+    return entry.get('thumb')
+
+
+def _fit_size(size, max_size):
+    """Size of `size` fitted into the `max_size` box (never upscaled)."""
+    w, h = size
+    s = min(1.0, max_size[0] / w, max_size[1] / h)
+    return max(1, math.ceil(w * s)), max(1, math.ceil(h * s))
+
+
+def open_scaled(path, max_size, timing=None, orientation=1):
+    """Open and decode an image at the smallest power-of-two scale that still
+    covers `max_size` (thumbnail-style box): JPEGs are scaled in the DCT domain
+    by draft(), other formats are shrunk with reduce() right after decoding.
+    The caller finishes with a LANCZOS resize. With an EXIF `orientation`
+    (see orientation_of()) the result is turned upright, `max_size` applying
+    to the upright image. The seconds spent opening and decoding are added to
+    `timing` ('open', 'decode') if given."""
+    t0 = time.perf_counter()
+    im = Image.open(path)
+    try:
+        if orientation in (5, 6, 7, 8):
+            max_size = (max_size[1], max_size[0])
+        target = _fit_size(im.size, max_size)
+        if im.format == 'JPEG':
+            im.draft(None, target)
+        t1 = time.perf_counter()
+        im.load()
+        factor = min(im.size[0] // target[0], im.size[1] // target[1])
+        if factor >= 2 and im.mode not in ('P', '1'):
+            reduced = im.reduce(1 << (factor.bit_length() - 1))
+            im.close()
+            im = reduced
+        if orientation in EXIF_TRANSPOSE:
+            upright = im.transpose(EXIF_TRANSPOSE[orientation])
+            im.close()
+            im = upright
+        if timing is not None:
+            timing['open'] = timing.get('open', 0.0) + t1 - t0
+            timing['decode'] = timing.get('decode', 0.0) + time.perf_counter() - t1
+        return im
+    except Exception:
+        im.close()
+        raise
+
+
+def orientation_of(src_rel):
+    """EXIF orientation (1-8) of a source according to the catalog; 1 if unknown."""
+    row = _catalog.get(src_rel)
+    return (row or {}).get('orientation') or 1
+
+
+def estimate_decode_bytes(path, max_size):
+    """Rough peak memory of open_scaled(path, max_size) plus the resized copies,
+    read from the image header only."""
+    with Image.open(path) as im:
+        w, h = im.size
+        target = _fit_size(im.size, max_size)
+        scale = 1
+        if im.format == 'JPEG':
+            k = min(w // target[0], h // target[1])
+            scale = next(i for i in (8, 4, 2, 1) if k >= i)
+    # Pillow stores decoded pixels with 4 bytes each for RGB(A)
+    decoded = math.ceil(w / scale) * math.ceil(h / scale) * 4
+    resized = target[0] * target[1] * 4
+    return decoded + decoded // 4 + 2 * resized
+
+
+def _encode(im, fmt, opts):
+    buf = io.BytesIO()
+    im.save(buf, format=fmt, **opts)
+    return buf.getvalue()
+
+
+def _ssim_planes(im, block=8):
+    """YCbCr planes of `im` cut into block×block windows: a float32 array of
+    shape (rows, cols, 3, block*block) for ssim()."""
+    a = np.asarray(im.convert('YCbCr'), dtype=np.float32)
+    rows, cols = a.shape[0] // block, a.shape[1] // block
+    a = a[:rows * block, :cols * block].reshape(rows, block, cols, block, 3)
+    return np.ascontiguousarray(a.transpose(0, 2, 4, 1, 3)).reshape(rows, cols, 3, block * block)
+
+
+def ssim(a, b):
+    """Mean SSIM of two _ssim_planes() arrays over their windows, with the Y,
+    Cb and Cr planes weighted by SSIM_WEIGHTS."""
+    if not a.size:
+        return 1.0
+    mu_a, mu_b = a.mean(axis=-1), b.mean(axis=-1)
+    var_a = (a * a).mean(axis=-1) - mu_a * mu_a
+    var_b = (b * b).mean(axis=-1) - mu_b * mu_b
+    cov = (a * b).mean(axis=-1) - mu_a * mu_b
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    s = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float((s.mean(axis=(0, 1)) * SSIM_WEIGHTS).sum())
+
+
+def search_quality(im, fmt, opts, hint=None):
+    """Bisect QUALITY_RANGE for the lowest quality whose decoded output keeps
+    ssim() >= TARGET_SSIM against `im`, which should be small (the trials are
+    run on the SSIM_SIZE comparison image, not the full rung). `hint` (the
+    quality chosen for this image last time) is tried first."""
+    ref = _ssim_planes(im)
+    lo, hi = QUALITY_RANGE
+    best = hi
+    q = hint if hint and lo <= hint <= hi else (lo + hi) // 2
+    while lo <= hi:
+        with Image.open(io.BytesIO(_encode(im, fmt, {**opts, 'quality': q}))) as out:
+            ok = ssim(ref, _ssim_planes(out)) >= TARGET_SSIM
+        if ok:
+            best = q
+            hi = q - 1
+        else:
+            lo = q + 1
+        q = (lo + hi) // 2
+    return best
+
+
+def _save_searched(im_rgb, stem, hints, baseline_ratio=None):
+    """ENCODER == 'ssim': write the JPEG and WebP of a rung at the quality found
+    by search_quality(); returns ([(kind, path)], {kind: quality}, bytes, bytes saved
+    against the fixed JPEG_SAVE/WEBP_SAVE encode). That fixed encode is only
+    estimated, for the report, from its size ratio to the searched encode on the
+    comparison image, measured once per ladder in `baseline_ratio` ({kind:
+    ratio}, shared by the rungs)."""
+    if baseline_ratio is None:
+        baseline_ratio = {}
+    probe = im_rgb
+    if max(im_rgb.size) > SSIM_SIZE:
+        probe = im_rgb.resize(_fit_size(im_rgb.size, (SSIM_SIZE, SSIM_SIZE)),
+                              resample=getattr(Image, 'Resampling', Image).BOX)
+    written, chosen = [], {}
+    size = saved = 0
+    for kind, fmt, opts, fixed, ext in (('img', 'JPEG', SEARCH_JPEG_SAVE, JPEG_SAVE, '.jpg'),
+                                        ('webp', 'WEBP', SEARCH_WEBP_SAVE, WEBP_SAVE, '.webp')):
+        try:
+            q = search_quality(probe, fmt, opts, hints.get(kind))
+            data = _encode(im_rgb, fmt, {**opts, 'quality': q})
+            if kind not in baseline_ratio:
+                baseline_ratio[kind] = (len(_encode(probe, fmt, fixed))
+                                        / len(_encode(probe, fmt, {**opts, 'quality': q})))
+            baseline = round(baseline_ratio[kind] * len(data))
+        except Exception:
+            if kind == 'img':
+                raise
+            continue
+        path = stem.with_suffix(ext)
+        path.write_bytes(data)
+        written.append((kind, path))
+        chosen[kind] = q
+        size += len(data)
+        saved += baseline - len(data)
+    return written, chosen, size, saved
+
+
+def _save_rung(im, base_path, width, largest, hints=None, baseline_ratio=None):
+    """Encode one rung of the ladder; returns ([(format, path)] written, extra
+    manifest fields: chosen qualities and bytes in ENCODER == 'ssim' mode).
+    `baseline_ratio` is passed on to _save_searched()."""
+    stem = base_path if largest else base_path.parent / RUNG_DIRNAME.format(width) / base_path.name
+    stem.parent.mkdir(exist_ok=True)
+    written = []
+    if im.mode in ('RGBA', 'LA'):
+        path = stem.with_suffix('.png')
+        im.save(path, format='PNG', optimize=True)
+        written.append(('img', path))
+    elif ENCODER == 'ssim':
+        written, chosen, size, saved = _save_searched(im.convert('RGB'), stem, hints or {}, baseline_ratio)
+        return written, {'q': chosen, 'bytes': size, 'saved': saved}
+    else:
+        path = stem.with_suffix('.jpg')
+        # Save as high-quality JPEG (less chroma subsampling, progressive)
+        im_rgb = im.convert('RGB')
+        im_rgb.save(path, format='JPEG', **JPEG_SAVE)
+        written.append(('img', path))
+        # Also write a WebP variant for browsers that support it
+        try:
+            webp_path = stem.with_suffix('.webp')
+            im_rgb.save(webp_path, format='WEBP', **WEBP_SAVE)
+            written.append(('webp', webp_path))
+        except Exception:
+            pass
+    return written, {}
+
+
+def _make_thumb(src_rel, stamp=None, hints=None, orientation=1):
+    """Decode src_rel once and write its derivative ladder: the THUMB_MAX_SIZE
+    thumbnail plus one smaller copy per THUMB_WIDTHS entry, each resized from
+    the previous (larger) rung. `hints` ({width: {'img': q, 'webp': q}}) are the
+    qualities the SSIM search chose last time; `orientation` is the source's EXIF
+    orientation. Returns the manifest entry, or None on failure."""
+    parts = src_rel.split(os.sep)
+    thumb_rel = os.path.join(*(['images', THUMB_DIRNAME] + parts[1:]))
+    base_path = (Path(d) / thumb_rel).with_suffix('')
+    timing = {'resize': 0.0, 'encode': 0.0}
+    try:
+        if stamp is None:
+            stamp = source_stamp(src_rel)
+        base_path.parent.mkdir(parents=True, exist_ok=True)
+        variants = []
+        with open_scaled(Path(d) / src_rel, THUMB_MAX_SIZE, timing, orientation) as im:
+            # Use high-quality resampling
+            resample = getattr(Image, 'Resampling', Image).LANCZOS
+            t = time.perf_counter()
+            im.thumbnail(THUMB_MAX_SIZE, resample=resample, reducing_gap=None)
+            if im.mode not in ('RGBA', 'LA', 'RGB', 'L'):
+                im = im.convert('RGB')
+            timing['resize'] += time.perf_counter() - t
+            size = im.size
+            rung = im
+            widths = [w for w in sorted(THUMB_WIDTHS, reverse=True) if w < size[0]]
+            baseline_ratio = {}
+            for w in [size[0]] + widths:
+                t = time.perf_counter()
+                if w != rung.size[0]:
+                    h = max(1, round(rung.size[1] * w / rung.size[0]))
+                    rung = rung.resize((w, h), resample=resample)
+                t2 = time.perf_counter()
+                written, extra = _save_rung(rung, base_path, w, w == size[0], (hints or {}).get(str(w)),
+                                            baseline_ratio)
+                timing['resize'] += t2 - t
+                timing['encode'] += time.perf_counter() - t2
+                variants.append({'w': w, **{k: os.path.relpath(p, d).replace('\\', '/')
+                                            for k, p in written}, **extra})
+        timing['read'] = os.path.getsize(Path(d) / src_rel)
+    except Exception:
+        return None
+    variants.reverse()
+    outputs = [v[k] for v in variants for k in ('img', 'webp') if k in v]
+    timing['written'] = sum(os.path.getsize(Path(d) / o) for o in outputs)
+    return {'stamp': stamp, 'settings': thumb_settings(), 'orientation': orientation,
+            'thumb': variants[-1]['img'], 'size': list(size), 'variants': variants,
+            'outputs': outputs, 'timing': timing}
+
+
+def thumb_variants(src_rel):
+    """Ladder recorded for a source ([{'w', 'img', 'webp'?}, ...] smallest first), or []."""
+    src_rel = canonical(src_rel)
+    if lookup_thumb(src_rel) == src_rel:
+        return []
+    entry = _manifest.get('sources', {}).get(src_rel) or {}
+    return entry.get('variants', [])
+
+
+def _probe(src_rel, want_lqip=False, orientation=1):
+    """Header-only (upright) size of a source and, if asked, a tiny blurred
+    placeholder (LQIP) as a base64 data URL."""
+    path = Path(d) / src_rel
+    with Image.open(path) as im:
+        info = {'size': list(im.size)[::-1] if orientation in (5, 6, 7, 8) else list(im.size)}
+    if want_lqip:
+        box = (LQIP_WIDTH * 4, LQIP_WIDTH * 4)
+        with open_scaled(path, box, orientation=orientation) as im:
+            resample = getattr(Image, 'Resampling', Image).LANCZOS
+            im.thumbnail((LQIP_WIDTH, LQIP_WIDTH), resample=resample, reducing_gap=None)
+            im = im.convert('RGB')
+            buf = io.BytesIO()
+            try:
+                im.save(buf, format='WEBP', quality=30, method=6)
+                mime = 'image/webp'
+            except Exception:
+                buf = io.BytesIO()
+                im.save(buf, format='JPEG', quality=30, optimize=True)
+                mime = 'image/jpeg'
+        info['lqip'] = f'data:{mime};base64,' + base64.b64encode(buf.getvalue()).decode('ascii')
+    return info
+
+
+def probe_images(srcs, jobs=None):
+    """Fill the manifest's per-source metadata (dimensions, LQIP) for srcs,
+    only reading sources whose stamp changed since the last build."""
+    meta = _manifest.setdefault('meta', {})
+    pending = []
+    stamps = {}
+    for src in sorted(set(canonical(s) for s in srcs)):
+        if not PIL_AVAILABLE or src.split(os.sep)[0] != 'images':
+            continue
+        try:
+            stamps[src] = source_stamp(src)
+        except Exception:
+            continue
+        entry = meta.get(src)
+        orientation = orientation_of(src)
+        if entry and entry.get('stamp') == stamps[src] and (not LQIP or 'lqip' in entry) \
+                and entry.get('orientation', 1) == orientation:
+            gallery_profile.count('probe.hit')
+            continue
+        size = gallery_catalog.display_size(_catalog.get(src))
+        if size and not LQIP:
+            # the catalog already knows the dimensions
+            gallery_profile.count('probe.hit')
+            meta[src] = {'stamp': stamps[src], 'size': list(size), 'orientation': orientation}
+            continue
+        gallery_profile.count('probe.miss')
+        pending.append(src)
+    if not pending:
+        return meta
+    if jobs is None:
+        jobs = JOBS
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(pending))
+    results = {}
+    if jobs > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_thumb_worker_init,
+                                     initargs=_worker_args()) as ex:
+                def collect(src, fut):
+                    if not fut.exception():
+                        results[src] = fut.result()
+                # only LQIPs decode pixels; header reads cost next to nothing
+                _run_bounded(ex, pending, jobs, lambda src: ex.submit(_probe, src, LQIP, orientation_of(src)),
+                             collect, (LQIP_WIDTH * 4, LQIP_WIDTH * 4) if LQIP else (1, 1))
+        except Exception as e:
+            print('Parallel image probing failed, falling back to serial:', e)
+    for src in pending:
+        if src not in results:
+            try:
+                results[src] = _probe(src, LQIP, orientation_of(src))
+            except Exception:
+                continue
+    for src, info in results.items():
+        meta[src] = {'stamp': stamps[src], 'orientation': orientation_of(src), **info}
+    return meta
+
+
+def image_meta(src_rel):
+    """Metadata recorded by probe_images() for a source ({'size', 'lqip'?}) or {}."""
+    return _manifest.get('meta', {}).get(canonical(src_rel)) or {}
+
+
+def _dims_attrs(src_rel):
+    """width/height (of the displayed derivative) and LQIP background attributes."""
+    src_rel = canonical(src_rel)
+    entry = _manifest.get('sources', {}).get(src_rel) if thumb_variants(src_rel) else None
+    meta = image_meta(src_rel)
+    size = (entry or {}).get('size') or meta.get('size')
+    attrs = f' width="{size[0]}" height="{size[1]}"' if size else ''
+    if LQIP and meta.get('lqip'):
+        attrs += f' style="background:url({meta["lqip"]}) center/cover no-repeat"'
+    return attrs
+
+
+def picture_html(src_rel, alt='', sizes='100vw', attrs=''):
+    """<img> (inside a <picture> with a WebP <source> when available) for a
+    source image, with srcset/sizes over its derivative ladder, its intrinsic
+    width/height and, with LQIP, a placeholder background."""
+    variants = thumb_variants(src_rel)
+    alt = html.escape(alt)
+    attrs = _dims_attrs(src_rel) + attrs
+    if not variants:
+        return f'<img src="{lookup_thumb(src_rel)}"{attrs} alt="{alt}">'
+    img_set = ', '.join(f'{v["img"]} {v["w"]}w' for v in variants)
+    tag = f'<img src="{variants[-1]["img"]}" srcset="{img_set}" sizes="{sizes}"{attrs} alt="{alt}">'
+    if all('webp' in v for v in variants):
+        webp_set = ', '.join(f'{v["webp"]} {v["w"]}w' for v in variants)
+        return f'<picture><source srcset="{webp_set}" sizes="{sizes}" type="image/webp">{tag}</picture>'
+    return tag
+
+
+def _record_thumb(src_rel, entry):
+    gallery_profile.count('thumbs.miss')
+    if entry is None:
+        _thumbs[src_rel] = src_rel
+        return src_rel
+    gallery_profile.record_image(src_rel, entry.pop('timing'))
+    # derivatives of the previous entry that the new one no longer writes
+    old = _manifest['sources'].get(src_rel) or {}
+    for o in set(old.get('outputs', [])) - set(entry['outputs']):
+        try:
+            os.remove(Path(d) / o)
+        except OSError:
+            pass
+    _manifest['sources'][src_rel] = entry
+    _thumbs[src_rel] = entry['thumb']
+    return entry['thumb']
+
+
 def ensure_thumb(src_rel):
     """Return relative thumbnail path for a source image path (e.g. 'images/folder/pic.jpg').
-    Create thumbnail if PIL available and thumb missing or stale."""
-    src_path = Path(d) / src_rel
+    Create thumbnail if PIL available and thumb missing or stale (per the manifest)."""
     parts = src_rel.split(os.sep)
     if parts[0] != 'images':
         return src_rel
     # if thumbs are disabled, always use the original image
-    if not USE_THUMBS:
+    if not USE_THUMBS or not PIL_AVAILABLE:
         return src_rel
-    thumb_parts = ['images', THUMB_DIRNAME] + parts[1:]
-    thumb_rel = os.path.join(*thumb_parts)
-    thumb_path = Path(d) / thumb_rel
-
-    if not PIL_AVAILABLE:
-        return src_rel
-
     try:
-        src_mtime = src_path.stat().st_mtime
+        stamp = source_stamp(src_rel)
     except Exception:
         return src_rel
+    thumb = cached_thumb(src_rel, stamp)
+    if thumb:
+        gallery_profile.count('thumbs.hit')
+        return thumb
+    return _record_thumb(src_rel, _make_thumb(src_rel, stamp, quality_hints(src_rel), orientation_of(src_rel)))
+
+
+def _thumb_worker_init(root, site_root, use_thumbs, max_size, widths, hash_sources, encoder, target_ssim):
+    """Copy the parent's settings into a worker process (needed with 'spawn')."""
+    global d, imgdir, site_dir, USE_THUMBS, THUMB_MAX_SIZE, THUMB_WIDTHS, HASH_SOURCES, ENCODER, TARGET_SSIM
+    d = root
+    imgdir = os.path.join(d, 'images')
+    site_dir = site_root
+    USE_THUMBS = use_thumbs
+    THUMB_MAX_SIZE = max_size
+    THUMB_WIDTHS = widths
+    HASH_SOURCES = hash_sources
+    ENCODER = encoder
+    TARGET_SSIM = target_ssim
+
+
+def _worker_args():
+    return (d, site_dir, USE_THUMBS, THUMB_MAX_SIZE, THUMB_WIDTHS, HASH_SOURCES, ENCODER, TARGET_SSIM)
+
+
+def quality_hints(src_rel):
+    """{width: {'img': q, 'webp': q}} chosen by the SSIM search for the source's
+    previous derivatives, used as the starting point of the next search."""
+    entry = _manifest.get('sources', {}).get(src_rel) or {}
+    return {str(v['w']): v['q'] for v in entry.get('variants', []) if 'q' in v}
+
+
+def generate_thumbs(srcs, jobs=None):
+    """Create the thumbnails for all given source paths up front, using a
+    process pool when jobs > 1. Up-to-date thumbnails (per the manifest) are
+    reused without decoding. Results are stored in `_thumbs`."""
+    pending = []
+    stamps = {}
+    for src in sorted(set(canonical(s) for s in srcs) - set(_thumbs)):
+        if not (USE_THUMBS and PIL_AVAILABLE) or src.split(os.sep)[0] != 'images':
+            _thumbs[src] = src
+            continue
+        try:
+            stamps[src] = source_stamp(src)
+        except Exception:
+            _thumbs[src] = src
+            continue
+        thumb = cached_thumb(src, stamps[src])
+        if thumb:
+            gallery_profile.count('thumbs.hit')
+            _thumbs[src] = thumb
+        else:
+            pending.append(src)
+    if not pending:
+        return _thumbs
+    if jobs is None:
+        jobs = JOBS
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(pending))
+
+    if jobs > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_thumb_worker_init,
+                                     initargs=_worker_args()) as ex:
+                _run_bounded(ex, pending, jobs,
+                             lambda src: ex.submit(_make_thumb, src, stamps[src], quality_hints(src),
+                                                   orientation_of(src)),
+                             lambda src, fut: _record_thumb(src, fut.result()))
+        except Exception as e:
+            print('Parallel thumbnail generation failed, falling back to serial:', e)
+    for src in pending:
+        if src not in _thumbs:
+            _record_thumb(src, _make_thumb(src, stamps[src], quality_hints(src), orientation_of(src)))
+    print(f'Thumbnails: {len(pending)} generated')
+    return _thumbs
+
+
+def _run_bounded(ex, pending, jobs, submit, collect, max_size=None):
+    """Submit one job per source to the pool (`submit(src)` returns its future)
+    while keeping the estimated decode memory of the jobs in flight (decoding
+    for `max_size`, THUMB_MAX_SIZE by default) under MEMORY_BUDGET_MB; one job
+    always runs. `collect(src, future)` is called as each job finishes."""
+    budget = MEMORY_BUDGET_MB * 1024 * 1024
+    costs = {}
+    for src in pending:
+        try:
+            costs[src] = estimate_decode_bytes(Path(d) / src, max_size or THUMB_MAX_SIZE)
+        except Exception:
+            costs[src] = 0
+    queue = list(pending)
+    running = {}
+    used = 0
+    while queue or running:
+        while queue and len(running) < jobs and (not running or not budget
+                                                 or used + costs[queue[0]] <= budget):
+            src = queue.pop(0)
+            running[submit(src)] = src
+            used += costs[src]
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for fut in done:
+            src = running.pop(fut)
+            used -= costs[src]
+            collect(src, fut)
+
+
+def prune_manifest(live_srcs):
+    """Forget sources that no longer exist and delete their derivatives and metadata,
+    as well as the derivatives of copies that now share a canonical source."""
+    live = set(live_srcs)
+    for src in list(_manifest.get('sources', {})):
+        if (src in live or (Path(d) / src).exists()) and canonical(src) == src:
+            continue
+        for o in _manifest['sources'].pop(src).get('outputs', []):
+            try:
+                os.remove(Path(d) / o)
+            except OSError:
+                pass
+    for src in list(_manifest.get('meta', {})):
+        if src not in live and not (Path(d) / src).exists():
+            del _manifest['meta'][src]
+
+
+def canonical(src_rel):
+    """The copy of src_rel whose derivatives and URL stand for every byte-identical
+    file (see find_duplicates()); src_rel itself unless DEDUP found a twin."""
+    return _canonical.get(src_rel, src_rel)
 
-    thumb_path.parent.mkdir(parents=True, exist_ok=True)
+
+def _dhash(path):
+    """64-bit difference hash of an image: 9×8 grayscale thumbnail (from a reduced
+    decode), one bit per horizontally adjacent pair."""
+    with open_scaled(path, (64, 64)) as im:
+        g = im.convert('L').resize((9, 8), resample=getattr(Image, 'Resampling', Image).LANCZOS)
+    if NUMPY_AVAILABLE:
+        a = np.asarray(g, dtype=np.int16)
+        return int.from_bytes(np.packbits(a[:, 1:] > a[:, :-1]).tobytes(), 'big')
+    px = list(g.getdata())
+    bits = 0
+    for y in range(8):
+        for x in range(8):
+            bits = bits << 1 | (px[y * 9 + x + 1] > px[y * 9 + x])
+    return bits
+
+
+def _fingerprint_source(src_rel, sha1=None):
+    """Content hash (unless already known) and dHash of a source."""
+    path = Path(d) / src_rel
+    return {'sha1': sha1 or _file_sha1(path), 'dhash': f'{_dhash(path):016x}'}
+
+
+def near_duplicates(hashes, max_bits=NEAR_DUP_BITS):
+    """Pairs of sources whose dHashes differ in at most max_bits (< DHASH_BANDS)
+    bits. Sources are bucketed by each 8-bit band of their hash: two hashes that
+    close share at least one band, so only bucket mates are compared."""
+    buckets = {}
+    for src, h in hashes.items():
+        for band in range(DHASH_BANDS):
+            buckets.setdefault((band, h >> (8 * band) & 0xff), []).append(src)
+    pairs = set()
+    for members in buckets.values():
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                if bin(hashes[a] ^ hashes[b]).count('1') <= max_bits:
+                    pairs.add((min(a, b), max(a, b)))
+    return sorted(pairs)
+
+
+def load_catalog(jobs=None):
+    """Update the metadata catalog (images/.thumbs/catalog.sqlite) from the
+    library scan, reading only the headers of new or modified images, and load
+    its rows into `_catalog`."""
+    _catalog.clear()
+    # loose files of images/ (the generated hero) are not photos of the library
+    stats = {rel: st for rel, st in _library['stats'].items()
+             if rel.lower().endswith(valid_ext) and os.path.dirname(rel) != 'images'}
     try:
-        if not thumb_path.exists() or thumb_path.stat().st_mtime < src_mtime:
-            with Image.open(src_path) as im:
-                # Use high-quality resampling
-                resample = getattr(Image, 'Resampling', Image).LANCZOS
-                im.thumbnail(THUMB_MAX_SIZE, resample=resample)
-                if im.mode in ('RGBA', 'LA'):
-                    thumb_path = thumb_path.with_suffix('.png')
-                    im.save(thumb_path, format='PNG', optimize=True)
-                else:
-                    thumb_path = thumb_path.with_suffix('.jpg')
-                    # Save as high-quality JPEG (less chroma subsampling, progressive)
-                    im_rgb = im.convert('RGB')
-                    im_rgb.save(
-                        thumb_path,
-                        format='JPEG',
-                        quality=100,
-                        optimize=True,
-                        progressive=True,
-                        subsampling=0,
-                    )
-                    # Also write a WebP variant for browsers that support it
-                    try:
-                        webp_path = thumb_path.with_suffix('.webp')
-                        im_rgb.save(webp_path, format='WEBP', quality=95, method=6)
-                    except Exception:
-                        pass
-    except Exception:
-        return src_rel
+        conn = gallery_catalog.connect(os.path.join(imgdir, THUMB_DIRNAME, gallery_catalog.CATALOG_NAME))
+        try:
+            read = gallery_catalog.update(conn, d, stats, jobs=JOBS if jobs is None else jobs)
+            _catalog.update(gallery_catalog.load(conn))
+        finally:
+            conn.close()
+    except Exception as e:
+        print('Could not update the metadata catalog:', e)
+        return
+    gallery_profile.count('catalog.miss', read)
+    gallery_profile.count('catalog.hit', len(stats) - read)
+
+
+def find_duplicates(srcs, jobs=None):
+    """Fingerprint srcs (content hash + dHash, cached in the manifest per source
+    stamp, computed on the process pool), point every byte-identical copy at one
+    canonical source (`_canonical`) and write the near duplicates to
+    images/.thumbs/duplicates.json."""
+    fps = _manifest.setdefault('dedup', {})
+    stamps, pending = {}, []
+    for src in sorted(set(srcs)):
+        if src.split(os.sep)[0] != 'images':
+            continue
+        try:
+            stamps[src] = source_stamp(src)
+        except Exception:
+            continue
+        entry = fps.get(src)
+        if entry and entry.get('stamp') == stamps[src]:
+            gallery_profile.count('dedup.hit')
+            continue
+        gallery_profile.count('dedup.miss')
+        pending.append(src)
+    if jobs is None:
+        jobs = JOBS
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(pending))
+    results = {}
+    if jobs > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_thumb_worker_init,
+                                     initargs=_worker_args()) as ex:
+                def collect(src, fut):
+                    if not fut.exception():
+                        results[src] = fut.result()
+                _run_bounded(ex, pending, jobs,
+                             lambda src: ex.submit(_fingerprint_source, src, stamps[src].get('sha1')),
+                             collect, (64, 64))
+        except Exception as e:
+            print('Parallel fingerprinting failed, falling back to serial:', e)
+    for src in pending:
+        try:
+            fps[src] = {'stamp': stamps[src], **(results.get(src) or _fingerprint_source(src, stamps[src].get('sha1')))}
+        except Exception:
+            continue
+    for src in [s for s in fps if not (Path(d) / s).exists()]:
+        del fps[src]
 
-    rel = os.path.relpath(thumb_path, d)
-    return rel.replace('\\', '/')
+    _canonical.clear()
+    by_hash = {}
+    for src in sorted(stamps):
+        if src in fps:
+            by_hash.setdefault(fps[src]['sha1'], []).append(src)
+    sources = _manifest.get('sources', {})
+    for copies in by_hash.values():
+        # keep the copy that already has derivatives, so adding a copy changes no URL
+        keep = next((c for c in copies if (sources.get(c) or {}).get('stamp') == stamps[c]), copies[0])
+        for src in copies:
+            if src != keep:
+                _canonical[src] = keep
+    near = near_duplicates({src: int(fps[src]['dhash'], 16) for src in stamps
+                            if src in fps and src not in _canonical})
+    report = {'exact': [copies for copies in by_hash.values() if len(copies) > 1],
+              'near': [list(p) for p in near]}
+    write_text_if_changed(os.path.join(imgdir, THUMB_DIRNAME, DUPLICATES_REPORT),
+                          json.dumps(report, ensure_ascii=False, indent=2))
+    if report['exact'] or near:
+        print(f'Duplicates: {len(_canonical)} exact copies share derivatives, '
+              f'{len(near)} near-duplicate pairs (see {THUMB_DIRNAME}/{DUPLICATES_REPORT})')
+    return report
 
 
-def create_top_hero(src_abs_paths, out_rel='images/top_hero.jpg', height=1080):
-    """Create a side-by-side image from up to two absolute image paths.
+def lookup_thumb(src_rel):
+    """Return the thumbnail computed by generate_thumbs(), creating it inline if missing."""
+    src_rel = canonical(src_rel)
+    thumb = _thumbs.get(src_rel)
+    if thumb is None:
+        thumb = _thumbs[src_rel] = ensure_thumb(src_rel)
+    return thumb
+
+
+def create_top_hero(src_abs_paths, out_rel='images/top_hero.jpg', height=1080, widths=None):
+    """Create a side-by-side image from up to two absolute image paths, plus
+    narrower copies for srcset (HERO_WIDTHS). The result is cached in the
+    manifest: nothing is decoded when the sources (and their order), height,
+    widths and encoder settings are unchanged.
     Returns the project-relative path (posix) or None on failure.
     """
     if not PIL_AVAILABLE:
         return None
+    if widths is None:
+        widths = HERO_WIDTHS
     try:
-        imgs = []
+        srcs = [os.path.relpath(p, d) for p in src_abs_paths[:2] if os.path.isfile(p)]
+        key = {'sources': [[s, source_stamp(s), orientation_of(s)] for s in srcs], 'height': height, 'out': out_rel,
+               'widths': sorted(widths), 'jpeg': HERO_JPEG_SAVE, 'webp': HERO_WEBP_SAVE}
+        if srcs and stage_is_fresh('top_hero', key):
+            return out_rel
+        # Resize images to the same height while keeping aspect ratio,
+        # decoding each one at a reduced scale and only one at a time
+        resample = getattr(Image, 'Resampling', Image).LANCZOS
+        resized = []
         for p in src_abs_paths[:2]:
             if os.path.isfile(p):
-                im = Image.open(p)
-                imgs.append(im.copy())
-                im.close()
-        if not imgs:
+                orientation = orientation_of(os.path.relpath(p, d))
+                with Image.open(p) as im:
+                    w, h = im.size[::-1] if orientation in (5, 6, 7, 8) else im.size
+                new_w = int(w * (height / h))
+                with open_scaled(p, (new_w, height), orientation=orientation) as im:
+                    resized.append(im.resize((new_w, height), resample=resample))
+        if not resized:
             return None
 
-        # Resize images to the same height while keeping aspect ratio
-        resample = getattr(Image, 'Resampling', Image).LANCZOS
-        resized = []
-        for im in imgs:
-            w, h = im.size
-            new_w = int(w * (height / h))
-            resized.append(im.resize((new_w, height), resample=resample))
-
         total_w = sum(im.size[0] for im in resized)
         mode = 'RGB'
         out_img = Image.new(mode, (total_w, height), (0, 0, 0))
@@ -121,176 +974,1012 @@ def create_top_hero(src_abs_paths, out_rel='images/top_hero.jpg', height=1080):
                 im = im.convert('RGB')
             out_img.paste(im, (x, 0))
             x += im.size[0]
+        for im in resized:
+            im.close()
 
         out_path = Path(d) / out_rel
         out_path.parent.mkdir(parents=True, exist_ok=True)
-        out_img.save(str(out_path), format='JPEG', quality=100, optimize=True, progressive=True, subsampling=0)
-        # Also write a WebP top-hero for modern browsers
-        try:
-            out_webp = out_path.with_suffix('.webp')
-            out_img.save(out_webp, format='WEBP', quality=100, method=6)
-        except Exception:
-            pass
+        outputs = []
+        variants = []
+        rung = out_img
+        for w in [total_w] + [w for w in sorted(widths, reverse=True) if w < total_w]:
+            if w != rung.size[0]:
+                rung = rung.resize((w, max(1, round(rung.size[1] * w / rung.size[0]))), resample=resample)
+            stem = out_path if w == total_w else out_path.with_name(f'{out_path.stem}-{w}w{out_path.suffix}')
+            rung.save(stem.with_suffix('.jpg'), format='JPEG', **HERO_JPEG_SAVE)
+            variant = {'w': w, 'img': os.path.relpath(stem.with_suffix('.jpg'), d).replace('\\', '/')}
+            # Also write a WebP top-hero for modern browsers
+            try:
+                rung.save(stem.with_suffix('.webp'), format='WEBP', **HERO_WEBP_SAVE)
+                variant['webp'] = os.path.relpath(stem.with_suffix('.webp'), d).replace('\\', '/')
+            except Exception:
+                pass
+            variants.append(variant)
+            outputs.extend(v for k, v in variant.items() if k != 'w')
         out_img.close()
-        for im in resized:
-            im.close()
+        variants.reverse()
+        record_stage('top_hero', key, outputs, size=[total_w, height], variants=variants)
         rel = os.path.relpath(out_path, d).replace('\\', '/')
         return rel
     except Exception:
         return None
 
 
-def collect_groups():
-    groups = {}
-    if os.path.isdir(imgdir):
-        for entry in sorted(os.listdir(imgdir)):
-            full = os.path.join(imgdir, entry)
-            # Skip the profil folder (we don't want a "profil" group in galleries)
-            if entry.lower() == 'profil':
-                continue
-            # Skip thumbnail cache folder and other hidden folders
-            if entry == THUMB_DIRNAME or entry.startswith('.'):
+def hero_html(variants, size, alt=''):
+    """<picture> for the combined top hero, loaded with high priority."""
+    img_set = ', '.join(f'{v["img"]} {v["w"]}w' for v in variants)
+    tag = (f'<img src="{variants[-1]["img"]}" srcset="{img_set}" sizes="{HERO_IMG_SIZES}" '
+           f'width="{size[0]}" height="{size[1]}" fetchpriority="high" alt="{html.escape(alt)}">')
+    if all('webp' in v for v in variants):
+        webp_set = ', '.join(f'{v["webp"]} {v["w"]}w' for v in variants)
+        return f'<picture><source srcset="{webp_set}" sizes="{HERO_IMG_SIZES}" type="image/webp">{tag}</picture>'
+    return tag
+
+
+def hero_preload(variants):
+    """<link rel=preload> for the hero so the browser fetches it before layout."""
+    if all('webp' in v for v in variants):
+        srcset = ', '.join(f'{v["webp"]} {v["w"]}w' for v in variants)
+        kind = ' type="image/webp"'
+    else:
+        srcset = ', '.join(f'{v["img"]} {v["w"]}w' for v in variants)
+        kind = ''
+    return (f'  <link rel="preload" as="image" imagesrcset="{srcset}" imagesizes="{HERO_IMG_SIZES}"'
+            f'{kind} fetchpriority="high">\n')
+
+
+def _list_dir(rel, cached):
+    """Listing of one directory below the project root:
+    {'mtime_ns', 'dirs': [names], 'files': {name: [size, mtime_ns]}}.
+    A cached listing is reused when the directory mtime did not change."""
+    full = os.path.join(d, rel)
+    mtime = os.stat(full).st_mtime_ns
+    if cached and cached.get('mtime_ns') == mtime:
+        return cached
+    listing = {'mtime_ns': mtime, 'dirs': [], 'files': {}}
+    with os.scandir(full) as it:
+        for entry in it:
+            try:
+                if entry.is_dir():
+                    listing['dirs'].append(entry.name)
+                elif entry.is_file():
+                    st = entry.stat()
+                    listing['files'][entry.name] = [st.st_size, st.st_mtime_ns]
+            except OSError:
                 continue
-            # Skip any dedicated miniature folders used as thumbnail repositories
-            low = entry.lower()
-            if low.startswith('miniature') or low == 'miniatures':
+    listing['dirs'].sort()
+    return listing
+
+
+def _is_miniature_dir(name):
+    low = name.lower()
+    return low.startswith('miniature') or low == 'miniatures'
+
+
+def scan_library(use_cache=False):
+    """Scan images/ once with os.scandir and build the library model used by
+    every writer: groups (nested folders become 'Parent/Child' groups),
+    miniature overrides, profile images and videos, and the size/mtime of
+    every file. With use_cache, the model is persisted in images/.thumbs and
+    unchanged directories (same mtime) are not listed again."""
+    global _library
+    cache_path = os.path.join(imgdir, THUMB_DIRNAME, LIBRARY_CACHE)
+    old_dirs = {}
+    if use_cache:
+        try:
+            with open(cache_path, encoding='utf-8') as f:
+                old_dirs = json.load(f).get('dirs', {})
+        except Exception:
+            old_dirs = {}
+
+    lib = {'dirs': {}, 'groups': {}, 'miniatures': {}, 'stats': {},
+           'profile': {'images': [], 'videos': []}}
+    if not os.path.isdir(imgdir):
+        _library = lib
+        return lib
+
+    def listing(rel):
+        lst = _list_dir(rel, old_dirs.get(rel))
+        lib['dirs'][rel] = lst
+        for name, st in lst['files'].items():
+            lib['stats'][os.path.join(rel, name)] = st
+        return lst
+
+    def images_in(rel, lst):
+        return [os.path.join(rel, f) for f in sorted(lst['files']) if f.lower().endswith(valid_ext)]
+
+    def walk_group(rel, name):
+        lst = listing(rel)
+        imgs = images_in(rel, lst)
+        if imgs:
+            lib['groups'][name] = imgs
+        for sub in lst['dirs']:
+            if sub == THUMB_DIRNAME or sub.startswith('.') or _is_miniature_dir(sub):
                 continue
-            if os.path.isdir(full):
-                imgs = [os.path.join('images', entry, f) for f in sorted(os.listdir(full))
-                        if f.lower().endswith(valid_ext)]
+            walk_group(os.path.join(rel, sub), f'{name}/{sub}')
+
+    root = listing('images')
+    # loose files in images/ are skipped (do not create a 'Général' group)
+    for entry in root['dirs']:
+        rel = os.path.join('images', entry)
+        # Skip thumbnail cache folder and other hidden folders
+        if entry == THUMB_DIRNAME or entry.startswith('.'):
+            continue
+        if entry.lower() == 'profil':
+            # profile images and videos (no "profil" group in galleries)
+            lst = listing(rel)
+            lib['profile']['images'] = images_in(rel, lst)
+            if 'videos' in lst['dirs']:
+                vrel = os.path.join(rel, 'videos')
+                vids = listing(vrel)['files']
+                lib['profile']['videos'] = [os.path.join(vrel, f) for f in sorted(vids)
+                                            if f.lower().endswith(VIDEO_EXT)]
+            continue
+        if _is_miniature_dir(entry):
+            # dedicated miniature folders: remember their first image
+            lst = listing(rel)
+            dirs = [(rel, lst)]
+            if entry.lower() == 'miniatures':
+                dirs += [(os.path.join(rel, sub), listing(os.path.join(rel, sub))) for sub in lst['dirs']]
+            for mrel, mlst in dirs:
+                imgs = images_in(mrel, mlst)
                 if imgs:
-                    groups[entry] = imgs
-            elif os.path.isfile(full) and entry.lower().endswith(valid_ext):
-                # skip loose files at project root (do not create a 'Général' group)
+                    lib['miniatures'][mrel] = imgs[0].replace('\\', '/')
+            continue
+        walk_group(rel, entry)
+
+    if use_cache:
+        try:
+            write_text_if_changed(cache_path, json.dumps({'dirs': lib['dirs']}, ensure_ascii=False,
+                                                         sort_keys=True))
+        except Exception as e:
+            print('Could not save library cache:', e)
+    _library = lib
+    return lib
+
+
+def collect_groups():
+    """Groups of the library ({name: [image paths]}), scanning images/ if needed."""
+    if _library is None:
+        scan_library()
+    return _library['groups']
+
+
+def collect_profile():
+    """Profile images and videos of the library ({'images': [...], 'videos': [...]})."""
+    if _library is None:
+        scan_library()
+    return _library['profile']
+
+
+def logo_url():
+    """URL of the banner logo: its content-hashed copy in assets/ (see build_assets())."""
+    return asset_url('logo')
+
+
+def find_miniature(name):
+    """Return the first image of a dedicated miniature folder for a group, or None."""
+    gslug = slug(name)
+    candidates = [
+        os.path.join('images', f'miniature_{gslug}'),
+        os.path.join('images', f'miniature {gslug}'),
+        os.path.join('images', 'miniatures', gslug),
+        os.path.join('images', f'miniature_{name}'),
+        os.path.join('images', f'miniature {name}'),
+    ]
+    if _library is None:
+        scan_library()
+    for md in candidates:
+        found = _library['miniatures'].get(md)
+        if found:
+            return found
+    return None
+
+
+def group_cover(name, imgs):
+    """Representative image of a group: a miniature override if any, else its first image."""
+    # if a miniature override exists, prefer it as representative image
+    return find_miniature(name) or imgs[0]
+
+
+def plan_thumbs(groups):
+    """List every source image whose thumbnail the pages will need."""
+    srcs = []
+    for key, imgs in groups.items():
+        srcs.extend(imgs)
+        srcs.append(group_cover(key, imgs))
+    return srcs
+
+
+# Shared stylesheet of the index (body.page-index) and group pages (body.page-group)
+SITE_CSS = '''
+body{font-family:system-ui;padding:20px;padding-top:130px;padding-bottom:64px;max-width:1100px;margin:auto}
+.top-banner{position:fixed;left:0;right:0;top:0;height:110px;background:linear-gradient(90deg,#062047,#043059);z-index:1000;box-shadow:0 2px 6px rgba(0,0,0,0.25);display:flex;align-items:center}
+.top-logo{height:72px;display:block}
+.bottom-bar{position:fixed;left:0;right:0;bottom:0;height:48px;background:linear-gradient(90deg,#062047,#043059);display:flex;align-items:center;justify-content:center;color:#fff;font-weight:600;z-index:1000;transform:translateY(100%);transition:transform 220ms ease-in-out}
+.bottom-bar.visible{transform:translateY(0)}
+.bottom-bar a{color:#fff;text-decoration:none;margin:0 8px}
+
+/* group pages */
+.page-group h1{font-size:28px;margin-bottom:0.4rem}
+.page-group .top-banner{justify-content:center;padding:0 22px}
+.page-group .top-logo{margin:0}
+.gallery{display:flex;flex-wrap:wrap;gap:16px;margin-top:18px}
+.gallery a{display:block}
+.gallery img{width:420px;height:300px;object-fit:cover;border-radius:8px}
+.gallery.virtual{display:block;position:relative}
+.gallery.virtual a{position:absolute}
+.gallery.virtual img{width:100%;height:100%}
+.pager{display:flex;flex-wrap:wrap;gap:6px;justify-content:center;margin:28px 0}
+.pager a,.pager span{padding:4px 10px;border-radius:6px;color:#062047;text-decoration:none}
+.pager .current{background:#062047;color:#fff}
+
+/* index */
+.page-index h1{font-size:48px;margin-bottom:12px}
+.page-index .top-banner{padding-left:22px}
+.page-index .section-label{font-size:24px;color:#222;margin-bottom:14px;text-transform:uppercase;letter-spacing:0.08em;font-weight:800}
+p.lead{font-size:18px;color:#444;margin-top:0.2rem;margin-bottom:1rem;line-height:1.4}
+.hero{padding:12px 0 18px}
+.top-hero{display:flex;justify-content:center;gap:0;margin:0 auto 48px;max-width:1400px;position:relative;overflow:hidden}
+.top-hero img{width:50%;height:auto;object-fit:cover;border-radius:0;display:block;transition:transform 700ms ease}
+.top-hero.combined picture{display:block;width:100%}
+.top-hero.combined img{width:100%;height:auto;object-fit:cover;border-radius:0;display:block}
+.top-hero img + img{margin-left:0}
+.top-hero-caption{position:absolute;left:0;right:0;bottom:0;background:rgba(0,0,0,0.45);color:#fff;padding:12px 0;text-align:center;font-weight:800;font-size:28px;letter-spacing:0.02em;box-sizing:border-box}
+.play-button{position:absolute;left:50%;top:50%;transform:translate(-50%,-50%);width:84px;height:84px;border-radius:50%;background:rgba(0,0,0,0.55);border:2px solid rgba(255,255,255,0.9);display:flex;align-items:center;justify-content:center;cursor:pointer;z-index:20;transition:transform 220ms ease,box-shadow 220ms ease}
+.play-button:after{content:"";display:block;margin-left:6px;border-style:solid;border-width:12px 0 12px 20px;border-color:transparent transparent transparent #fff}
+.play-button:hover{transform:translate(-50%,-50%) scale(1.04);box-shadow:0 8px 20px rgba(6,32,71,0.18)}
+.video-modal{position:fixed;left:0;top:0;right:0;bottom:0;background:rgba(0,0,0,0.75);display:none;align-items:center;justify-content:center;z-index:2000}
+.video-modal.open{display:flex}
+.video-wrap{position:relative;max-width:92%;max-height:92%}
+.video-wrap video{width:100%;height:auto;border-radius:6px;background:#000}
+.video-close{position:absolute;right:-10px;top:-10px;background:#fff;color:#000;border:none;border-radius:50%;width:36px;height:36px;font-size:18px;cursor:pointer}
+.groups{display:grid;grid-template-columns:repeat(2,1fr);gap:36px}
+.group{text-align:center;padding:6px}
+.group img{width:100%;height:380px;object-fit:cover;border-radius:8px;transition:transform 320ms cubic-bezier(.2,.8,.2,1),box-shadow 320ms ease}
+.group:hover img{transform:scale(1.04);box-shadow:0 12px 30px rgba(6,32,71,0.12)}
+.group .title{margin-top:10px;font-size:18px;font-weight:700;color:#222}
+.group a{color:inherit;text-decoration:none}
+.animate-on-scroll{opacity:0;transform:translateY(18px);transition:opacity 600ms ease,transform 600ms ease}
+.animate-on-scroll.visible{opacity:1;transform:none}
+@keyframes pulse{0%{transform:scale(1)}50%{transform:scale(1.06)}100%{transform:scale(1)}}
+@media(max-width:900px){.groups{grid-template-columns:1fr}.top-hero{flex-direction:column;align-items:center}.top-hero img{width:100%;height:auto;margin-left:0}}
+@media(max-width:600px){.page-index .top-logo{height:48px;padding-left:12px}}
+.section{margin-bottom:140px}
+'''
+
+# Shared script: bottom bar, profile video modal, animate-on-scroll and hero parallax
+SITE_JS = '''
+// bottom contact bar: show it once the page is scrolled to the end
+(function(){
+  var bar=document.querySelector('.bottom-bar');
+  function check(){if(!bar) return; if((window.innerHeight+window.scrollY)>=document.documentElement.scrollHeight-2){bar.classList.add('visible');}else{bar.classList.remove('visible');}}
+  window.addEventListener('scroll',check,{passive:true});
+  window.addEventListener('resize',check);
+  document.addEventListener('DOMContentLoaded',check);
+  check();
+})();
+// profile video modal: open modal and play when play button clicked
+(function(){
+  var play=document.querySelector('.play-button');
+  var modal=document.getElementById('video-modal');
+  var vid=modal?modal.querySelector('#profile-video'):null;
+  var closeBtn=modal?modal.querySelector('.video-close'):null;
+  function openVideo(){if(!modal||!vid) return;modal.classList.add('open');try{vid.currentTime=0;vid.play();}catch(e){}}
+  function closeVideo(){if(!modal||!vid) return;try{vid.pause();}catch(e){}modal.classList.remove('open');}
+  if(play){play.addEventListener('click',function(e){e.preventDefault();openVideo();});}
+  // about to be clicked: start buffering
+  if(play&&vid){['mouseenter','focus','touchstart'].forEach(function(ev){play.addEventListener(ev,function(){vid.preload='auto';},{passive:true});});}
+  if(closeBtn){closeBtn.addEventListener('click',function(e){e.preventDefault();closeVideo();});}
+  if(modal){modal.addEventListener('click',function(e){if(e.target===modal){closeVideo();}});document.addEventListener('keydown',function(e){if(e.key==='Escape') closeVideo();});}
+})();
+// intersection observer for animate-on-scroll and small parallax for top-hero
+(function(){
+  var els=document.querySelectorAll('.animate-on-scroll');
+  if(els.length&&'IntersectionObserver' in window){
+    var io=new IntersectionObserver(function(entries){entries.forEach(function(e){if(e.isIntersecting){e.target.classList.add('visible');io.unobserve(e.target);}});},{threshold:0.12});
+    els.forEach(function(el){io.observe(el)});
+  }
+  var topHero=document.querySelector('.top-hero');
+  if(topHero){
+    var imgs=topHero.querySelectorAll("img");
+    window.addEventListener('scroll',function(){var rect=topHero.getBoundingClientRect();var h=window.innerHeight;var pct=1-Math.max(0,Math.min(1,(rect.top+h)/(h+rect.height)));imgs.forEach(function(img,i){var offset=(pct-0.5)*(i%2?6:-6);img.style.transform='translateY('+offset+'px)';});},{passive:true});
+  }
+})();
+// virtualized group pages: only the tiles near the viewport are in the DOM
+(function(){
+  var box=document.querySelector('.gallery[data-manifest]');
+  if(!box||!window.fetch) return;
+  var TILE_W=420,TILE_H=300,GAP=16,BUFFER=2;
+  var items=[],sizes='',cols=1,tileW=TILE_W,nodes={},queued=false;
+  function q(v){return String(v).replace(/&/g,'&amp;').replace(/"/g,'&quot;');}
+  function tile(it,i){
+    var x=(i%cols)*(tileW+GAP),y=Math.floor(i/cols)*(TILE_H+GAP);
+    var img='<img src="'+q(it.s)+'"'+(it.ss?' srcset="'+q(it.ss)+'" sizes="'+q(sizes)+'"':'')+' decoding="async" alt="">';
+    if(it.ws) img='<picture><source srcset="'+q(it.ws)+'" sizes="'+q(sizes)+'" type="image/webp">'+img+'</picture>';
+    var bg=it.l?';background:url('+it.l+') center/cover no-repeat':'';
+    var div=document.createElement('div');
+    div.innerHTML='<a href="'+q(it.h)+'" target="_blank" style="left:'+x+'px;top:'+y+'px;width:'+tileW+'px;height:'+TILE_H+'px'+bg+'">'+img+'</a>';
+    return div.firstChild;
+  }
+  function render(){
+    queued=false;
+    var top=box.getBoundingClientRect().top,row=TILE_H+GAP;
+    var a=Math.max(0,Math.floor(-top/row)-BUFFER)*cols;
+    var b=Math.min(items.length,(Math.ceil((window.innerHeight-top)/row)+BUFFER)*cols);
+    Object.keys(nodes).forEach(function(k){if(k<a||k>=b){box.removeChild(nodes[k]);delete nodes[k];}});
+    for(var i=a;i<b;i++){if(!nodes[i]){nodes[i]=tile(items[i],i);box.appendChild(nodes[i]);}}
+  }
+  function layout(){
+    var w=box.clientWidth||TILE_W;
+    cols=Math.max(1,Math.floor((w+GAP)/(TILE_W+GAP)));
+    tileW=Math.min(TILE_W,w);
+    box.style.height=(Math.ceil(items.length/cols)*(TILE_H+GAP))+'px';
+    box.innerHTML='';nodes={};
+    render();
+  }
+  function schedule(){if(!queued){queued=true;requestAnimationFrame(render);}}
+  fetch(box.getAttribute('data-manifest')).then(function(r){return r.json();}).then(function(m){
+    items=m.items;sizes=m.sizes;layout();
+    window.addEventListener('scroll',schedule,{passive:true});
+    window.addEventListener('resize',layout);
+  });
+})();
+// group links: prefetch the page once the link nears the viewport, and the
+// first row of its thumbnails on hover/focus, so the page opens warm
+(function(){
+  var links=document.querySelectorAll('a[data-prefetch]');
+  var conn=navigator.connection;
+  if(!links.length||(conn&&(conn.saveData||/2g/.test(conn.effectiveType||'')))) return;
+  var done={};
+  function pages(a){
+    a.getAttribute('data-prefetch').split(' ').forEach(function(u){
+      if(!u||done[u]) return;
+      done[u]=1;
+      var l=document.createElement('link');l.rel='prefetch';l.href=u;document.head.appendChild(l);
+    });
+  }
+  function images(a){
+    if(a.hasAttribute('data-prefetched')) return;
+    a.setAttribute('data-prefetched','');
+    pages(a);
+    var sizes=a.getAttribute('data-prefetch-sizes')||'';
+    (a.getAttribute('data-prefetch-img')||'').split('|').forEach(function(set){
+      if(!set) return;
+      // same srcset and sizes as the tile: the browser picks the same candidate
+      var im=new Image();im.decoding='async';if(sizes) im.sizes=sizes;im.srcset=set;
+    });
+  }
+  var io='IntersectionObserver' in window?new IntersectionObserver(function(entries){entries.forEach(function(e){if(e.isIntersecting){pages(e.target);io.unobserve(e.target);}});},{rootMargin:'200px'}):null;
+  links.forEach(function(a){
+    if(io) io.observe(a);
+    ['mouseenter','focus','touchstart'].forEach(function(ev){a.addEventListener(ev,function(){images(a);},{passive:true});});
+  });
+})();
+'''
+
+ASSETS_DIRNAME = 'assets'
+# Fingerprinted asset URLs of the current build ({'css', 'js', 'logo'}), see build_assets()
+_assets = {}
+
+
+def minify_css(text):
+    """Strip comments and the whitespace CSS does not need."""
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,:])\s*', r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def _css_rules(css):
+    """Top-level (prelude, body) pairs of minified CSS; @media bodies are
+    returned as text, to be split again."""
+    rules, i = [], 0
+    while True:
+        j = css.find('{', i)
+        if j < 0:
+            return rules
+        depth, k = 1, j + 1
+        while depth and k < len(css):
+            depth += {'{': 1, '}': -1}.get(css[k], 0)
+            k += 1
+        rules.append((css[i:j].strip(), css[j + 1:k - 1]))
+        i = k
+
+
+def _selector_matches(selector, classes, tags, ids):
+    """Whether every class, tag and id named in `selector` occurs in the page
+    (pseudo-classes ignored): a cheap over-approximation of "may apply"."""
+    selector = re.sub(r'::?[\w-]+(\([^)]*\))?|\[[^\]]*\]', '', selector)
+    for prefix, name in re.findall(r'([.#]?)(-?[A-Za-z_][\w-]*)', selector):
+        if (prefix == '.' and name not in classes or prefix == '#' and name not in ids
+                or not prefix and name.lower() not in tags):
+            return False
+    return True
+
+
+def critical_css(fragment, css=None):
+    """The rules of the site stylesheet (or `css`) that can apply to the HTML
+    `fragment` (the top of a page), keeping @media blocks and dropping
+    @keyframes, as minified CSS to inline in <head>. The state classes SITE_JS
+    toggles (`.visible`, `.open`) count as present: without their rules the
+    inlined `.animate-on-scroll{opacity:0}` would keep the top of the page
+    hidden until the full stylesheet loads. So do the CRITICAL_CHROME
+    classes, which would otherwise show as unstyled blocks."""
+    classes = {c for v in re.findall(r'\bclass="([^"]*)"', fragment) for c in v.split()}
+    classes |= set(re.findall(r"classList\.(?:add|toggle)\('([\w-]+)'", SITE_JS))
+    classes |= set(CRITICAL_CHROME)
+    tags = {t.lower() for t in re.findall(r'<([A-Za-z][\w-]*)', fragment)}
+    ids = set(re.findall(r'\bid="([^"]*)"', fragment))
+
+    def keep(text):
+        out = []
+        for prelude, body in _css_rules(text):
+            if prelude.startswith('@media'):
+                inner = keep(body)
+                if inner:
+                    out.append(f'{prelude}{{{inner}}}')
+            elif not prelude.startswith('@'):
+                sels = [sel for sel in prelude.split(',') if _selector_matches(sel, classes, tags, ids)]
+                if sels:
+                    out.append(f'{",".join(sels)}{{{body}}}')
+        return ''.join(out)
+    return keep(minify_css(SITE_CSS if css is None else css))
+
+
+def minify_js(text):
+    """Conservative JS minifier: drop whole-line // comments and indentation."""
+    lines = (l.strip() for l in text.splitlines())
+    return '\n'.join(l for l in lines if l and not l.startswith('//'))
+
+
+# Contents that must not be touched by minify_html()
+_RAW_HTML = re.compile(r'(<(script|style|pre|textarea)\b[^>]*>)(.*?)(</\2\s*>)', re.S | re.I)
+
+
+def _squeeze_html(text):
+    text = re.sub(r'<!--(?!\[).*?-->', '', text, flags=re.S)
+    # whitespace spanning a line break between two tags is never rendered
+    text = re.sub(r'>\s*\n\s*<', '><', text)
+    return re.sub(r'\s+', ' ', text)
+
+
+def minify_html(text):
+    """Drop comments, indentation and line breaks between tags; inline <style>
+    and <script> bodies go through minify_css()/minify_js(), <pre> and
+    <textarea> are kept verbatim."""
+    out = []
+    pos = 0
+    for m in _RAW_HTML.finditer(text):
+        out.append(_squeeze_html(text[pos:m.start()]))
+        tag, body = m.group(2).lower(), m.group(3)
+        if tag == 'style':
+            body = minify_css(body)
+        elif tag == 'script' and 'type=' not in m.group(1).lower():
+            body = minify_js(body)
+        out.append(m.group(1) + body + m.group(4))
+        pos = m.end()
+    out.append(_squeeze_html(text[pos:]))
+    return ''.join(out).strip() + '\n'
+
+
+def site_json(obj):
+    """JSON text of a served file: compact with MINIFY, indented otherwise."""
+    if MINIFY:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+def _compress_file(rel):
+    """Write the .gz (zopfli if installed, else zlib level 9) and, with a Brotli
+    module, the .br sibling of a served file. Returns the content hash."""
+    path = os.path.join(site_dir, rel)
+    with open(path, 'rb') as f:
+        data = f.read()
+    if zopfli_gzip is not None:
+        packed = {'.gz': zopfli_gzip.compress(data)}
+    else:
+        packed = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        packed['.br'] = brotli.compress(data, quality=11)
+    for ext, blob in packed.items():
+        tmp = f'{path}{ext}.tmp{os.getpid()}'
+        with open(tmp, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp, path + ext)
+    return hashlib.sha1(data).hexdigest()
+
+
+def served_files():
+    """Text files of the generated site worth precompressing, relative to
+    site_dir: the pages and JSON the build writes (not any other .html/.json
+    of the folder, e.g. a --profile report) and the shared CSS/JS."""
+    slugs = {slug(key) for key in collect_groups()}
+    files = []
+    for fn in sorted(os.listdir(site_dir)) if os.path.isdir(site_dir) else []:
+        m = re.fullmatch(r'gallery_((.+?)(_p\d+)?)\.(html|json)', fn)
+        if fn in ('gallery.html', SEED_NAME) or m and (m.group(1) in slugs or m.group(2) in slugs):
+            files.append(fn)
+    asset_dir = os.path.join(site_dir, ASSETS_DIRNAME)
+    if os.path.isdir(asset_dir):
+        files += [os.path.join(ASSETS_DIRNAME, fn) for fn in sorted(os.listdir(asset_dir))
+                  if fn.endswith(('.css', '.js', '.svg'))]
+    return files
+
+
+def site_files():
+    """Every generated file the published site serves, relative to site_dir:
+    the served_files(), their .gz/.br siblings and the other assets."""
+    files = served_files()
+    files += [rel + ext for rel in list(files) for ext in ('.gz', '.br')
+              if os.path.exists(os.path.join(site_dir, rel + ext))]
+    asset_dir = os.path.join(site_dir, ASSETS_DIRNAME)
+    if os.path.isdir(asset_dir):
+        files += [os.path.join(ASSETS_DIRNAME, fn) for fn in sorted(os.listdir(asset_dir))
+                  if not fn.endswith(('.css', '.js', '.svg', '.gz', '.br')) and '.tmp' not in fn]
+    return files
+
+
+def site_images(groups):
+    """Every project file under images/ the pages refer to, relative to the
+    project root: the (canonical) photos of the groups, their covers and the
+    profile pictures and videos, their thumbnails, and the stage outputs
+    (top hero). Nothing of the build's own bookkeeping (manifest, seed
+    previews, catalog)."""
+    srcs = [canonical(src) for src in plan_thumbs(groups) + collect_profile()['images']]
+    files = set(srcs) | set(collect_profile()['videos'])
+    sources = _manifest.get('sources', {}) if USE_THUMBS else {}
+    for src in srcs:
+        files.update((sources.get(src) or {}).get('outputs', []))
+    for entry in _manifest.get('stages', {}).values():
+        files.update(entry.get('outputs', []))
+    for entry in _manifest.get('videos', {}).values():
+        files.update(entry[k] for k in ('src', 'poster') if k in entry)
+    return sorted(os.path.normpath(f) for f in files if os.path.isfile(os.path.join(d, f)))
+
+
+def precompress(jobs=None):
+    """Write .gz/.br siblings of served_files() so a static server can send them
+    without compressing on the fly. Only files whose content hash changed since
+    the last build (or whose siblings are missing) are compressed."""
+    state = _manifest.setdefault('compressed', {})
+    exts = ('.gz', '.br') if brotli is not None else ('.gz',)
+    pending = []
+    files = served_files()
+    for rel in files:
+        path = os.path.join(site_dir, rel)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entry = state.get(rel)
+        stamp = [st.st_size, st.st_mtime_ns]
+        if entry and all(os.path.exists(path + e) for e in exts):
+            if entry.get('stamp') == stamp:
+                gallery_profile.count('compress.hit')
                 continue
-    return groups
+            if entry.get('sha1') == _file_sha1(path):
+                # rewritten with the same bytes: the siblings are still valid
+                for e in exts:
+                    os.utime(path + e, ns=(st.st_mtime_ns, st.st_mtime_ns))
+                entry['stamp'] = stamp
+                gallery_profile.count('compress.hit')
+                continue
+        gallery_profile.count('compress.miss')
+        pending.append((rel, stamp))
+
+    if jobs is None:
+        jobs = JOBS
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(pending))
+    results = {}
+    if jobs > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_thumb_worker_init,
+                                     initargs=_worker_args()) as ex:
+                futs = {rel: ex.submit(_compress_file, rel) for rel, _ in pending}
+                for rel, fut in futs.items():
+                    try:
+                        results[rel] = fut.result()
+                    except Exception:
+                        pass
+        except Exception as e:
+            print('Parallel compression failed, falling back to serial:', e)
+    for rel, stamp in pending:
+        try:
+            sha1 = results.get(rel) or _compress_file(rel)
+        except OSError as e:
+            print('Could not compress', rel, e)
+            continue
+        state[rel] = {'stamp': stamp, 'sha1': sha1}
+
+    live = set(files)
+    for rel in list(state):
+        if rel not in live:
+            del state[rel]
+    if pending:
+        print(f'Precompressed {len(pending)} files ({"+".join(e[1:] for e in exts)})')
+
+
+def prune_compressed():
+    """Delete .gz/.br siblings whose file is gone or was rewritten after them,
+    whether or not this build precompresses: static servers (nginx gzip_static…)
+    would send their stale bytes."""
+    live = set(served_files())
+    for rel in ('.', ASSETS_DIRNAME):
+        folder = os.path.join(site_dir, rel)
+        for fn in os.listdir(folder) if os.path.isdir(folder) else []:
+            base, ext = os.path.splitext(fn)
+            if ext not in ('.gz', '.br') or not base.endswith(('.html', '.json', '.css', '.js', '.svg')):
+                continue
+            src = os.path.normpath(os.path.join(rel, base))
+            try:
+                stale = src not in live or \
+                    os.stat(os.path.join(folder, fn)).st_mtime_ns < os.stat(os.path.join(site_dir, src)).st_mtime_ns
+                if stale:
+                    os.remove(os.path.join(folder, fn))
+            except OSError:
+                pass
+
+
+def _fingerprint(data):
+    return hashlib.sha1(data).hexdigest()[:10]
+
+
+def write_asset(name, data):
+    """Write data as assets/<stem>.<hash><ext> (once) and return its relative URL."""
+    stem, ext = os.path.splitext(name)
+    rel = f'{ASSETS_DIRNAME}/{stem}.{_fingerprint(data)}{ext}'
+    path = os.path.join(site_dir, rel)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.tmp{os.getpid()}'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return rel
+
+
+def build_assets():
+    """Write the minified shared CSS/JS and a copy of the logo under
+    content-hash names, remove stale versions and fill `_assets`."""
+    _assets.clear()
+    _assets['css'] = write_asset('site.css', minify_css(SITE_CSS).encode('utf-8'))
+    _assets['js'] = write_asset('site.js', minify_js(SITE_JS).encode('utf-8'))
+    try:
+        with open(os.path.join(d, 'logo_white.png'), 'rb') as f:
+            _assets['logo'] = write_asset('logo_white.png', f.read())
+    except OSError:
+        _assets['logo'] = 'logo_white.png'
+    live = {os.path.basename(p) for p in _assets.values()}
+    asset_dir = os.path.join(site_dir, ASSETS_DIRNAME)
+    for fn in os.listdir(asset_dir):
+        stem = fn.split('.', 1)[0]
+        # keep the precompressed siblings of live assets
+        if fn not in live and re.sub(r'\.(gz|br)$', '', fn) not in live and stem in ('site', 'logo_white'):
+            os.remove(os.path.join(asset_dir, fn))
+    return _assets
+
+
+def asset_url(kind):
+    """URL of a shared asset ('css', 'js' or 'logo'), building the assets if needed."""
+    if not _assets:
+        build_assets()
+    return _assets[kind]
+
+
+def page_head(title, extra='', fold=None):
+    """<head> shared by the generated pages (`extra`: more <head> lines). With
+    `fold`, the HTML at the top of the page, and CRITICAL_CSS, the rules it
+    needs are inlined and the full stylesheet is loaded without blocking."""
+    css = asset_url('css')
+    if fold is not None and CRITICAL_CSS:
+        style = (f'  <style>{critical_css(fold)}</style>\n'
+                 f'  <link rel="preload" href="{css}" as="style" onload="this.onload=null;this.rel=\'stylesheet\'">\n'
+                 f'  <noscript><link rel="stylesheet" href="{css}"></noscript>\n')
+    else:
+        style = f'  <link rel="stylesheet" href="{css}">\n'
+    return ('<!doctype html>\n<html>\n<head>\n  <meta charset="utf-8">\n'
+            f'  <title>{html.escape(title)}</title>\n'
+            '  <meta name="viewport" content="width=device-width,initial-scale=1">\n'
+            f'  <link rel="preload" as="image" href="{logo_url()}">\n'
+            f'{extra}{style}'
+            '</head>\n')
+
+
+def group_page_name(gslug, page=1):
+    """File name of page `page` of a group (page 1 keeps the historical name)."""
+    return f'gallery_{gslug}.html' if page == 1 else f'gallery_{gslug}_p{page}.html'
+
+
+def _tile_html(src, position=FIRST_ROW):
+    """Tile of a group page at `position` on the page: tiles of the first row
+    load eagerly, the first one at high priority (usually the largest paint)."""
+    if position == 0:
+        attrs = ' fetchpriority="high"'
+    elif position < FIRST_ROW:
+        attrs = ' decoding="async"'
+    else:
+        attrs = ' loading="lazy" decoding="async"'
+    return (f'<a href="{canonical(src)}" target="_blank">'
+            + picture_html(src, sizes=GROUP_IMG_SIZES, attrs=attrs) + '</a>')
+
+
+def _tiles_html(imgs):
+    return ''.join(_tile_html(src, i) for i, src in enumerate(imgs))
+
+
+def prefetch_attrs(name, imgs):
+    """data-prefetch* attributes of an index link to a group: the group page
+    (and its JSON in virtual mode) and the srcsets of its first row of
+    thumbnails, which site.js prefetches."""
+    gslug = slug(name)
+    urls = [group_page_name(gslug)] + ([f'gallery_{gslug}.json'] if GROUP_MODE == 'virtual' else [])
+    sets = []
+    for src in imgs[:FIRST_ROW]:
+        variants = thumb_variants(src)
+        if not variants:
+            sets.append(lookup_thumb(src).replace(os.sep, '/'))
+        else:
+            key = 'webp' if all('webp' in v for v in variants) else 'img'
+            sets.append(', '.join(f'{v[key]} {v["w"]}w' for v in variants))
+    return (f' data-prefetch="{html.escape(" ".join(urls))}" data-prefetch-img="{html.escape("|".join(sets))}"'
+            f' data-prefetch-sizes="{GROUP_IMG_SIZES}"')
+
+
+def _pager_html(gslug, page, count):
+    """Prev/next links plus the first, last and nearby page numbers."""
+    if count <= 1:
+        return ''
+    parts = ['<nav class="pager">']
+    if page > 1:
+        parts.append(f'<a href="{group_page_name(gslug, page - 1)}" rel="prev">&larr;</a>')
+    shown = sorted({1, count} | set(range(max(1, page - 2), min(count, page + 2) + 1)))
+    prev = 0
+    for n in shown:
+        if n > prev + 1:
+            parts.append('<span>…</span>')
+        if n == page:
+            parts.append(f'<span class="current">{n}</span>')
+        else:
+            parts.append(f'<a href="{group_page_name(gslug, n)}">{n}</a>')
+        prev = n
+    if page < count:
+        parts.append(f'<a href="{group_page_name(gslug, page + 1)}" rel="next">&rarr;</a>')
+    parts.append('</nav>\n')
+    return ''.join(parts)
+
+
+def group_manifest(imgs):
+    """Compact per-image data for the virtualized group page."""
+    items = []
+    for src in imgs:
+        item = {'h': canonical(src).replace(os.sep, '/')}
+        variants = thumb_variants(src)
+        if variants:
+            item['s'] = variants[-1]['img']
+            item['ss'] = ', '.join(f'{v["img"]} {v["w"]}w' for v in variants)
+            if all('webp' in v for v in variants):
+                item['ws'] = ', '.join(f'{v["webp"]} {v["w"]}w' for v in variants)
+        else:
+            item['s'] = lookup_thumb(src).replace(os.sep, '/')
+        lqip = image_meta(src).get('lqip')
+        if LQIP and lqip:
+            item['l'] = lqip
+        items.append(item)
+    return {'sizes': GROUP_IMG_SIZES, 'items': items}
+
+
+def _remove_stale_pages(gslug, count, keep_json):
+    pat = re.compile(rf'gallery_{re.escape(gslug)}_p(\d+)\.html$')
+    for fn in os.listdir(site_dir):
+        m = pat.match(fn)
+        if m and int(m.group(1)) > count:
+            os.remove(os.path.join(site_dir, fn))
+    json_path = os.path.join(site_dir, f'gallery_{gslug}.json')
+    if not keep_json and os.path.exists(json_path):
+        os.remove(json_path)
 
 
 def write_group_page(name, imgs):
+    """Write the page(s) of a group according to GROUP_MODE: one page with
+    every image ('single'), GROUP_PAGE_SIZE images per page ('paged'), or one
+    page rendering tiles from gallery_<slug>.json near the viewport ('virtual')."""
     gslug = slug(name)
-    outp = os.path.join(d, f'gallery_{gslug}.html')
-    with open(outp, 'w', encoding='utf-8') as h:
-        h.write('<!doctype html>\n<html>\n<head>\n  <meta charset="utf-8">\n')
-        h.write(f'  <title>Portfolio — {html.escape(name)}</title>\n')
-        h.write('  <meta name="viewport" content="width=device-width,initial-scale=1">\n')
-        h.write('  <style>body{font-family:system-ui;padding:20px;padding-top:130px;padding-bottom:64px;max-width:1100px;margin:auto} '
-            'h1{font-size:28px;margin-bottom:0.4rem} .gallery{display:flex;flex-wrap:wrap;gap:16px;margin-top:18px} '
-            '.gallery a{display:block}.gallery img{width:420px;height:300px;object-fit:cover;border-radius:8px} '
-            '.top-banner{position:fixed;left:0;right:0;top:0;height:110px;background:linear-gradient(90deg,#062047,#043059);z-index:1000;box-shadow:0 2px 6px rgba(0,0,0,0.25);display:flex;justify-content:center;align-items:center;padding:0 22px} .top-logo{height:72px;display:block;margin:0} '
-            '.bottom-bar{position:fixed;left:0;right:0;bottom:0;height:48px;background:linear-gradient(90deg,#062047,#043059);display:flex;align-items:center;justify-content:center;color:#fff;font-weight:600;z-index:1000;transform:translateY(100%);transition:transform 220ms ease-in-out} .bottom-bar.visible{transform:translateY(0)} .bottom-bar a{color:#fff;text-decoration:none;margin:0 8px}</style>\n')
-        h.write('</head>\n<body>\n')
-        # fixed top banner with logo (logo_white.png expected at project root)
-        logo_src = f'logo_white.png?v={int(time.time())}'
-        h.write(f'<div class="top-banner"><img class="top-logo" src="{logo_src}" alt="LR"></div>\n')
-        h.write(f'<h1>{html.escape(name)}</h1>\n')
-        h.write('<p><a href="gallery.html">&larr; Retour</a></p>\n')
-        h.write('<div class="section-label">Portfolio</div>\n')
-        h.write('<div class="gallery">')
-        for src in imgs:
-                thumb = ensure_thumb(src)
-                src_attr = thumb if thumb and thumb != src else src
-                h.write(f'<a href="{src}" target="_blank">')
-                # prefer webp if available
-                if thumb and thumb != src:
-                    webp_rel = os.path.splitext(thumb)[0] + '.webp'
-                    if (Path(d) / webp_rel).exists():
-                        h.write(f'<picture><source srcset="{webp_rel}" type="image/webp"><img src="{thumb}" loading="lazy" alt=""></picture>')
-                    else:
-                        h.write(f'<img src="{thumb}" loading="lazy" alt="">')
-                else:
-                    h.write(f'<img src="{src_attr}" loading="lazy" alt="">')
-                h.write('</a>')
-        h.write('</div>\n')
-        # bottom contact bar
-        h.write(f'<div class="bottom-bar"><span style="margin-right:8px">Mon Insta:</span><a href="https://instagram.com/leonard_rossel" target="_blank">@leonard_rossel</a><span style="margin:0 12px">·</span><span style="margin-right:8px">Mon mail:</span><a href="mailto:leonardrosselpro@gmail.com">leonardrosselpro@gmail.com</a></div>\n')
-        h.write('<script>\n(function(){var bar=document.querySelector(\'.bottom-bar\');function check(){if(!bar) return; if((window.innerHeight+window.scrollY)>=document.documentElement.scrollHeight-2){bar.classList.add(\'visible\');}else{bar.classList.remove(\'visible\');}}window.addEventListener(\'scroll\',check,{passive:true});window.addEventListener(\'resize\',check);document.addEventListener(\'DOMContentLoaded\',check);check();})();\n</script>\n')
-        h.write('<script>\n// profile video modal: open modal and play when play button clicked\n(function(){var play=document.querySelector(\'.play-button\');var modal=document.getElementById(\'video-modal\');var vid=modal?modal.querySelector(\'#profile-video\'):null;var closeBtn=modal?modal.querySelector(\'.video-close\'):null;function openVideo(){if(!modal||!vid) return;modal.classList.add(\'open\');try{vid.currentTime=0;vid.play();}catch(e){}}function closeVideo(){if(!modal||!vid) return;try{vid.pause();}catch(e){}modal.classList.remove(\'open\');}if(play){play.addEventListener(\'click\',function(e){e.preventDefault();openVideo();});}if(closeBtn){closeBtn.addEventListener(\'click\',function(e){e.preventDefault();closeVideo();});}if(modal){modal.addEventListener(\'click\',function(e){if(e.target===modal){closeVideo();}});document.addEventListener(\'keydown\',function(e){if(e.key===\'Escape\') closeVideo();});} })();\n</script>\n')
-        h.write('<script>\n// profile video modal: open modal and play when play button clicked\n(function(){var play=document.querySelector(\'.play-button\');var modal=document.getElementById(\'video-modal\');var vid=modal?modal.querySelector(\'#profile-video\'):null;var closeBtn=modal?modal.querySelector(\'.video-close\'):null;function openVideo(){if(!modal||!vid) return;modal.classList.add(\'open\');try{vid.currentTime=0;vid.play();}catch(e){}}function closeVideo(){if(!modal||!vid) return;try{vid.pause();}catch(e){}modal.classList.remove(\'open\');}if(play){play.addEventListener(\'click\',function(e){e.preventDefault();openVideo();});}if(closeBtn){closeBtn.addEventListener(\'click\',function(e){e.preventDefault();closeVideo();});}if(modal){modal.addEventListener(\'click\',function(e){if(e.target===modal){closeVideo();}});document.addEventListener(\'keydown\',function(e){if(e.key===\'Escape\') closeVideo();});} })();\n</script>\n')
-        h.write('<script>\n// profile video modal: open modal and play when play button clicked\n(function(){var play=document.querySelector(\'.play-button\');var modal=document.getElementById(\'video-modal\');var vid=modal?modal.querySelector(\'#profile-video\'):null;var closeBtn=modal?modal.querySelector(\'.video-close\'):null;function openVideo(){if(!modal||!vid) return;modal.classList.add(\'open\');try{vid.currentTime=0;vid.play();}catch(e){}}function closeVideo(){if(!modal||!vid) return;try{vid.pause();}catch(e){}modal.classList.remove(\'open\');}if(play){play.addEventListener(\'click\',function(e){e.preventDefault();openVideo();});}if(closeBtn){closeBtn.addEventListener(\'click\',function(e){e.preventDefault();closeVideo();});}if(modal){modal.addEventListener(\'click\',function(e){if(e.target===modal){closeVideo();}});document.addEventListener(\'keydown\',function(e){if(e.key===\'Escape\') closeVideo();});} })();\n</script>\n')
-        h.write('</body>\n</html>')
-    print('wrote', outp)
+    if GROUP_MODE == 'virtual':
+        manifest_rel = f'gallery_{gslug}.json'
+        write_text_if_changed(os.path.join(site_dir, manifest_rel),
+                              json.dumps(group_manifest(imgs), ensure_ascii=False, separators=(',', ':')))
+        first = _tiles_html(imgs[:GROUP_PAGE_SIZE])
+        pages = [f'<div class="gallery virtual" data-manifest="{manifest_rel}" data-count="{len(imgs)}">'
+                 f'</div>\n<noscript><div class="gallery">{first}</div></noscript>\n']
+    else:
+        size = GROUP_PAGE_SIZE if GROUP_MODE == 'paged' and GROUP_PAGE_SIZE > 0 else len(imgs) or 1
+        chunks = [imgs[i:i + size] for i in range(0, len(imgs), size)] or [[]]
+        pages = []
+        for n, chunk in enumerate(chunks, 1):
+            pager = _pager_html(gslug, n, len(chunks))
+            pages.append('<div class="gallery">' + _tiles_html(chunk)
+                         + '</div>\n' + pager)
+    for n, body in enumerate(pages, 1):
+        outp = os.path.join(site_dir, group_page_name(gslug, n))
+        with io.StringIO() as h:
+            h.write('<body class="page-group">\n')
+            # fixed top banner with logo (logo_white.png expected at project root)
+            logo_src = logo_url()
+            h.write(f'<div class="top-banner"><img class="top-logo" src="{logo_src}" alt="LR"></div>\n')
+            h.write(f'<h1>{html.escape(name)}</h1>\n')
+            h.write('<p><a href="gallery.html">&larr; Retour</a></p>\n')
+            h.write('<div class="section-label">Portfolio</div>\n')
+            h.write(body)
+            fold = h.tell()
+            # bottom contact bar
+            h.write(f'<div class="bottom-bar"><span style="margin-right:8px">Mon Insta:</span><a href="https://instagram.com/leonard_rossel" target="_blank">@leonard_rossel</a><span style="margin:0 12px">·</span><span style="margin-right:8px">Mon mail:</span><a href="mailto:leonardrosselpro@gmail.com">leonardrosselpro@gmail.com</a></div>\n')
+            h.write(f'<script src="{asset_url("js")}" defer></script>\n')
+            h.write('</body>\n</html>')
+            page = h.getvalue()
+            page = page_head(f'Portfolio — {name}', fold=page[:fold]) + page
+            changed = write_text_if_changed(outp, minify_html(page) if MINIFY else page)
+        print('wrote' if changed else 'unchanged', outp)
+    _remove_stale_pages(gslug, len(pages), GROUP_MODE == 'virtual')
+
+
+def _video_sidecars(src_rel):
+    """Pictures next to a video with the same name (clip.mp4 -> clip.jpg)."""
+    stem = os.path.splitext(src_rel)[0]
+    return [stem + ext for ext in valid_ext if os.path.isfile(os.path.join(d, stem + ext))]
+
+
+def _poster_image(src_rel):
+    """Image to show before a video plays: a sidecar picture (see
+    _video_sidecars()), else the cover art embedded in the file, as (bytes,
+    extension) or None. Frames are not decoded (no video codec here)."""
+    for cand in _video_sidecars(src_rel):
+        with open(os.path.join(d, cand), 'rb') as f:
+            return f.read(), os.path.splitext(cand)[1].lower()
+    try:
+        return gallery_video.cover_art(os.path.join(d, src_rel))
+    except (OSError, ValueError):
+        return None
+
+
+def _write_poster(data, ext):
+    """Save a poster (at most POSTER_MAX_WIDTH wide) under its content hash."""
+    out_dir = Path(imgdir) / THUMB_DIRNAME / VIDEO_DIRNAME
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if PIL_AVAILABLE:
+        try:
+            with Image.open(io.BytesIO(data)) as im:
+                im.thumbnail((POSTER_MAX_WIDTH, POSTER_MAX_WIDTH * 4))
+                buf = io.BytesIO()
+                im.convert('RGB').save(buf, format='JPEG', **HERO_JPEG_SAVE)
+            data, ext = buf.getvalue(), '.jpg'
+        except Exception:
+            pass
+    out = out_dir / f'{_fingerprint(data)}-poster{ext}'
+    if not out.exists():
+        out.write_bytes(data)
+    return os.path.relpath(out, d).replace(os.sep, '/')
+
+
+def prepare_video(src_rel):
+    """Make a profile video quick to start: when its moov atom comes after
+    the media data, a fast-start copy is written (streamed, see
+    gallery_video.faststart()) and served instead, and a poster is extracted.
+    Derivatives are named by content hash and the result is cached in the
+    manifest by source stamp. Returns {'src', 'poster'?, 'width'?, 'height'?}."""
+    videos = _manifest.setdefault('videos', {})
+    stamp = source_stamp(src_rel)
+    key = {'stamp': stamp, 'sidecars': [[p, source_stamp(p)] for p in _video_sidecars(src_rel)]}
+    entry = videos.get(src_rel)
+    if (entry and entry.get('key') == key
+            and all(os.path.exists(os.path.join(d, entry[k])) for k in ('src', 'poster') if k in entry)):
+        gallery_profile.count('video.hit')
+        return entry
+    gallery_profile.count('video.miss')
+    path = os.path.join(d, src_rel)
+    entry = {'key': key, 'src': src_rel.replace(os.sep, '/')}
+    try:
+        info = gallery_video.probe(path)
+    except (OSError, ValueError) as e:
+        print(f'Video {src_rel} not inspected: {e}')
+        info = None
+    if info:
+        if info['width']:
+            entry['width'], entry['height'] = info['width'], info['height']
+        if not info['faststart']:
+            out_dir = Path(imgdir) / THUMB_DIRNAME / VIDEO_DIRNAME
+            out = out_dir / f'{_file_sha1(path)}{os.path.splitext(src_rel)[1].lower()}'
+            if not out.exists():
+                out_dir.mkdir(parents=True, exist_ok=True)
+                gallery_video.faststart(path, out)
+                print('Fast-start copy written:', out)
+            entry['src'] = os.path.relpath(out, d).replace(os.sep, '/')
+    poster = _poster_image(src_rel)
+    if poster:
+        entry['poster'] = _write_poster(*poster)
+    videos[src_rel] = entry
+    return entry
+
+
+def prepare_videos(srcs):
+    """prepare_video() for each source, then forget the other videos and
+    delete the derivatives nothing refers to."""
+    done = {}
+    for src in srcs:
+        try:
+            done[src] = prepare_video(src)
+        except Exception as e:
+            print(f'Could not prepare video {src}:', e)
+    videos = _manifest.setdefault('videos', {})
+    for src in [s for s in videos if s not in done]:
+        del videos[src]
+    live = {e[k] for e in videos.values() for k in ('src', 'poster') if k in e}
+    video_dir = Path(imgdir) / THUMB_DIRNAME / VIDEO_DIRNAME
+    for path in video_dir.iterdir() if video_dir.is_dir() else []:
+        if os.path.relpath(path, d).replace(os.sep, '/') not in live:
+            try:
+                path.unlink()
+            except OSError as e:
+                print('Could not delete stale video file', path, e)
+    return done
 
 
 def write_index(groups):
-    index_out = os.path.join(d, 'gallery.html')
-    with open(index_out, 'w', encoding='utf-8') as h:
-        h.write('<!doctype html>\n<html>\n<head>\n  <meta charset="utf-8">\n  <title>Portfolio</title>\n')
-        h.write('  <meta name="viewport" content="width=device-width,initial-scale=1">\n')
-        h.write('  <style>\n')
-        h.write('    body{font-family:system-ui;padding:20px;padding-top:130px;padding-bottom:64px;max-width:1100px;margin:auto}\n')
-        h.write('    h1{font-size:48px;margin-bottom:12px}\n')
-        h.write('    .section-label{font-size:24px;color:#222;margin-bottom:14px;text-transform:uppercase;letter-spacing:0.08em;font-weight:800}\n')
-        h.write('    p.lead{font-size:18px;color:#444;margin-top:0.2rem;margin-bottom:1rem;line-height:1.4}\n')
-        h.write('    .top-banner{position:fixed;left:0;right:0;top:0;height:110px;background:linear-gradient(90deg,#062047,#043059);z-index:1000;box-shadow:0 2px 6px rgba(0,0,0,0.25);display:flex;align-items:center;padding-left:22px}\n')
-        h.write('    .top-logo{height:72px;display:block}\n')
-        h.write('    .hero{padding:12px 0 18px}\n')
-        h.write('    .top-hero{display:flex;justify-content:center;gap:0;margin:0 auto 48px;max-width:1400px;position:relative;overflow:hidden}\n')
-        h.write('    .top-hero img{width:50%;height:auto;object-fit:cover;border-radius:0;display:block;transition:transform 700ms ease}\n')
-        h.write('    .top-hero.combined img{width:100%;height:auto;object-fit:cover;border-radius:0;display:block}\n')
-        h.write('    .top-hero img + img{margin-left:0}\n')
-        h.write('    .top-hero-caption{position:absolute;left:0;right:0;bottom:0;background:rgba(0,0,0,0.45);color:#fff;padding:12px 0;text-align:center;font-weight:800;font-size:28px;letter-spacing:0.02em;box-sizing:border-box}\n')
-        h.write('    .play-button{position:absolute;left:50%;top:50%;transform:translate(-50%,-50%);width:84px;height:84px;border-radius:50%;background:rgba(0,0,0,0.55);border:2px solid rgba(255,255,255,0.9);display:flex;align-items:center;justify-content:center;cursor:pointer;z-index:20;transition:transform 220ms ease,box-shadow 220ms ease} .play-button:after{content:"";display:block;margin-left:6px;border-style:solid;border-width:12px 0 12px 20px;border-color:transparent transparent transparent #fff} .play-button:hover{transform:translate(-50%,-50%) scale(1.04);box-shadow:0 8px 20px rgba(6,32,71,0.18)}\n')
-        h.write('    .groups{display:grid;grid-template-columns:repeat(2,1fr);gap:36px}\n')
-        h.write('    .group{text-align:center;padding:6px}\n')
-        h.write('    .group img{width:100%;height:380px;object-fit:cover;border-radius:8px;transition:transform 320ms cubic-bezier(.2,.8,.2,1),box-shadow 320ms ease}\n')
-        h.write('    .group:hover img{transform:scale(1.04);box-shadow:0 12px 30px rgba(6,32,71,0.12)}\n')
-        h.write('    .animate-on-scroll{opacity:0;transform:translateY(18px);transition:opacity 600ms ease,transform 600ms ease}\n')
-        h.write('    .animate-on-scroll.visible{opacity:1;transform:none}\n')
-        h.write('    @keyframes pulse{0%{transform:scale(1)}50%{transform:scale(1.06)}100%{transform:scale(1)}}\n')
-        h.write('    .play-button{position:absolute;left:50%;top:50%;transform:translate(-50%,-50%);width:84px;height:84px;border-radius:50%;background:rgba(0,0,0,0.55);border:2px solid rgba(255,255,255,0.9);display:flex;align-items:center;justify-content:center;cursor:pointer;z-index:20} .play-button:after{content:\"\";display:block;margin-left:6px;border-style:solid;border-width:12px 0 12px 20px;border-color:transparent transparent transparent #fff}\n')
-        h.write('    .video-modal{position:fixed;left:0;top:0;right:0;bottom:0;background:rgba(0,0,0,0.75);display:none;align-items:center;justify-content:center;z-index:2000} .video-modal.open{display:flex} .video-wrap{position:relative;max-width:92%;max-height:92%} .video-wrap video{width:100%;height:auto;border-radius:6px;background:#000} .video-close{position:absolute;right:-10px;top:-10px;background:#fff;color:#000;border:none;border-radius:50%;width:36px;height:36px;font-size:18px;cursor:pointer}\n')
-        h.write('    .groups{display:grid;grid-template-columns:repeat(2,1fr);gap:36px}\n')
-        h.write('    .group{text-align:center;padding:6px}\n')
-        h.write('    .group img{width:100%;height:380px;object-fit:cover;border-radius:8px}\n')
-        h.write('    .group .title{margin-top:10px;font-size:18px;font-weight:700;color:#222}\n')
-        h.write('    .group a{color:inherit;text-decoration:none}\n')
-        h.write('    @media(max-width:900px){.groups{grid-template-columns:1fr}.top-hero{flex-direction:column;align-items:center}.top-hero img{width:100%;height:auto;margin-left:0}}\n')
-        h.write('    @media(max-width:600px){.top-logo{height:48px;padding-left:12px}}\n')
-        h.write('    .bottom-bar{position:fixed;left:0;right:0;bottom:0;height:48px;background:linear-gradient(90deg,#062047,#043059);display:flex;align-items:center;justify-content:center;color:#fff;font-weight:600;z-index:1000;transform:translateY(100%);transition:transform 220ms ease-in-out} .bottom-bar.visible{transform:translateY(0)} .bottom-bar a{color:#fff;text-decoration:none;margin:0 8px}\n')
-        h.write('    .section{margin-bottom:140px}\n')
-        h.write('  </style>\n')
-        h.write('</head>\n<body>\n')
+    index_out = os.path.join(site_dir, 'gallery.html')
+    profile = collect_profile()
+    prof_imgs = profile['images']
+    hero = None
+    if prof_imgs:
+        abs_paths = [os.path.join(d, p) for p in prof_imgs[:2]]
+        try:
+            with gallery_profile.stage('index.hero'):
+                ok = create_top_hero(abs_paths, out_rel='images/top_hero.jpg', height=HERO_HEIGHT)
+            if ok:
+                hero = stage_entry('top_hero')
+        except Exception:
+            pass
+    with io.StringIO() as h:
+        h.write('<body class="page-index">\n')
         # fixed top banner with logo (logo_white.png expected at project root)
-        logo_src = f'logo_white.png?v={int(time.time())}'
+        logo_src = logo_url()
         h.write(f'<div class="top-banner"><img class="top-logo" src="{logo_src}" alt="LR"></div>\n')
         # Section 1 — Profil (deux images)
         h.write('<section class="section profile-section">')
-        prof_dir = os.path.join(d, 'images', 'profil')
-        if os.path.isdir(prof_dir):
-            prof_imgs = [f for f in sorted(os.listdir(prof_dir)) if f.lower().endswith(valid_ext)]
-            if prof_imgs:
-                abs_paths = [os.path.join(prof_dir, f) for f in prof_imgs[:2]]
-                # detect first video in profil/videos if present
-                vids_dir = os.path.join(prof_dir, 'videos')
-                video_rel = None
-                if os.path.isdir(vids_dir):
-                    vids = [f for f in sorted(os.listdir(vids_dir)) if f.lower().endswith(('.mp4', '.webm', '.mov', '.m4v', '.ogg'))]
-                    if vids:
-                        video_rel = os.path.join('images', 'profil', 'videos', vids[0]).replace('\\', '/')
-                try:
-                    create_top_hero(abs_paths, out_rel='images/top_hero.jpg', height=720)
-                except Exception:
-                    pass
+        if prof_imgs:
+            # first video in profil/videos if present (its fast-start copy, see prepare_video())
+            video = _manifest.get('videos', {}).get(profile['videos'][0]) if profile['videos'] else None
+            if profile['videos'] and not video:
+                video = {'src': profile['videos'][0].replace('\\', '/')}
+            video_rel = video['src'] if video else None
+            if hero:
+                # both profile images composed side by side, served at the right width
+                h.write('<div class="top-hero combined animate-on-scroll">')
+                h.write(hero_html(hero['variants'], hero['size']))
+            else:
                 h.write('<div class="top-hero animate-on-scroll">')
-                for fname in prof_imgs[:2]:
-                    p = os.path.join('images', 'profil', fname)
-                    h.write(f'<img src="{p}" alt="">')
-                # overlay caption across both profile images
-                h.write('<div class="top-hero-caption">Léonard Rossel</div>')
-                # play button if a video is available
-                if video_rel:
-                    h.write(f'<button class="play-button" data-video="{video_rel}" aria-label="Play video"></button>')
-                h.write('</div>\n')
-                # video modal markup (outside top-hero) if video present
-                if video_rel:
-                    h.write(f'<div class="video-modal" id="video-modal">')
-                    h.write('<div class="video-wrap">')
-                    h.write(f'<video id="profile-video" controls playsinline preload="metadata">')
-                    h.write(f'<source src="{video_rel}" />')
-                    h.write('Your browser does not support the video tag.')
-                    h.write('</video>')
-                    h.write('<button class="video-close" aria-label="Close video">×</button>')
-                    h.write('</div></div>')
+                for p in prof_imgs[:2]:
+                    h.write(f'<img src="{p.replace(os.sep, "/")}"{_dims_attrs(p)} fetchpriority="high" alt="">')
+            # overlay caption across both profile images
+            h.write('<div class="top-hero-caption">Léonard Rossel</div>')
+            # play button if a video is available
+            if video_rel:
+                h.write(f'<button class="play-button" data-video="{video_rel}" aria-label="Play video"></button>')
+            h.write('</div>\n')
+            # video modal markup (outside top-hero) if video present
+            if video_rel:
+                h.write(f'<div class="video-modal" id="video-modal">')
+                h.write('<div class="video-wrap">')
+                poster = f' poster="{video["poster"]}"' if 'poster' in video else ''
+                dims = f' width="{video["width"]}" height="{video["height"]}"' if 'width' in video else ''
+                kind = VIDEO_TYPES.get(os.path.splitext(video_rel)[1].lower())
+                h.write(f'<video id="profile-video" controls playsinline preload="metadata"{poster}{dims}>')
+                h.write(f'<source src="{video_rel}"' + (f' type="{kind}"' if kind else '') + ' />')
+                h.write('Your browser does not support the video tag.')
+                h.write('</video>')
+                h.write('<button class="video-close" aria-label="Close video">×</button>')
+                h.write('</div></div>')
         h.write('</section>\n')
 
         # Section 2 — Introspection (texte)
@@ -302,12 +1991,10 @@ def write_index(groups):
         h.write('  <p class="lead">Aujourd’hui, je prends ce rêve en main pour créer et transmettre. Je veux vous permettre de raconter votre histoire à travers la photo ou la vidéo.</p>\n')
         h.write('</div>')
         h.write('</section>\n')
+        fold = h.tell()
 
         # Bottom contact bar (script will toggle visibility)
         h.write(f'<div class="bottom-bar"><span style="margin-right:8px">Mon Insta:</span><a href="https://instagram.com/leonard_rossel" target="_blank">@leonard_rossel</a><span style="margin:0 12px">·</span><span style="margin-right:8px">Mon mail:</span><a href="mailto:leonardrosselpro@gmail.com">leonardrosselpro@gmail.com</a></div>\n')
-        h.write('<script>\n(function(){var bar=document.querySelector(\'.bottom-bar\');function check(){if(!bar) return; if((window.innerHeight+window.scrollY)>=document.documentElement.scrollHeight-2){bar.classList.add(\'visible\');}else{bar.classList.remove(\'visible\');}}window.addEventListener(\'scroll\',check,{passive:true});window.addEventListener(\'resize\',check);document.addEventListener(\'DOMContentLoaded\',check);check();})();\n</script>\n')
-        # Video modal script (index) — open modal and play when play button clicked
-        h.write('<script>\n(function(){var play=document.querySelector(\'.play-button\');var modal=document.getElementById(\'video-modal\');var vid=modal?modal.querySelector(\'#profile-video\'):null;var closeBtn=modal?modal.querySelector(\'.video-close\'):null;function openVideo(){if(!modal||!vid) return;modal.classList.add(\'open\');try{vid.currentTime=0;vid.play();}catch(e){}}function closeVideo(){if(!modal||!vid) return;try{vid.pause();}catch(e){}modal.classList.remove(\'open\');}if(play){play.addEventListener(\'click\',function(e){e.preventDefault();openVideo();});}if(closeBtn){closeBtn.addEventListener(\'click\',function(e){e.preventDefault();closeVideo();});}if(modal){modal.addEventListener(\'click\',function(e){if(e.target===modal){closeVideo();}});document.addEventListener(\'keydown\',function(e){if(e.key===\'Escape\') closeVideo();});} })();\n</script>\n')
 
         # Section 3 — Portfolio (grid of groups)
         h.write('<section class="section gallery-section">')
@@ -324,120 +2011,442 @@ def write_index(groups):
             return (len(preferred_order), kl)
         keys = sorted(all_keys, key=_key)
 
-        for key in keys:
+        for i, key in enumerate(keys):
             imgs = groups[key]
             gslug = slug(key)
-            # allow override with a dedicated miniature folder
-            mini_found = None
-            candidates = [
-                os.path.join('images', f'miniature_{gslug}'),
-                os.path.join('images', f'miniature {gslug}'),
-                os.path.join('images', 'miniatures', gslug),
-                os.path.join('images', f'miniature_{key}'),
-                os.path.join('images', f'miniature {key}'),
-            ]
-            for md in candidates:
-                md_full = Path(d) / md
-                if md_full.is_dir():
-                    files = [f for f in sorted(os.listdir(md_full)) if f.lower().endswith(valid_ext)]
-                    if files:
-                        mini_found = os.path.join(md, files[0]).replace('\\', '/')
-                        break
-
-            rep = imgs[0]
-            # if a miniature override exists, prefer it as representative image
-            if mini_found:
-                rep = mini_found
-
-            rep_thumb = ensure_thumb(rep)
-            write_group_page(key, imgs)
-            h.write('<div class="group animate-on-scroll">')
-            h.write(f'<a href="gallery_{gslug}.html">')
-            # group representative: prefer webp if present
-            rep_src = (rep_thumb if rep_thumb and rep_thumb != rep else rep)
-            if rep_thumb and rep_thumb != rep:
-                rep_webp = os.path.splitext(rep_thumb)[0] + '.webp'
-                if (Path(d) / rep_webp).exists():
-                    h.write(f'<picture><source srcset="{rep_webp}" type="image/webp"><img src="{rep_thumb}" alt="{html.escape(key)}"></picture>')
-                else:
-                    h.write(f'<img src="{rep_thumb}" alt="{html.escape(key)}">')
+            rep = group_cover(key, imgs)
+            # first row eager (at high priority when no hero competes), the rest lazy
+            if i < FIRST_ROW:
+                attrs = ' decoding="async"' + ('' if hero else ' fetchpriority="high"')
             else:
-                h.write(f'<img src="{rep_src}" alt="{html.escape(key)}">')
+                attrs = ' loading="lazy" decoding="async"'
+            h.write('<div class="group animate-on-scroll">')
+            h.write(f'<a href="gallery_{gslug}.html"{prefetch_attrs(key, imgs)}>')
+            h.write(picture_html(rep, alt=key, sizes=COVER_IMG_SIZES, attrs=attrs))
             h.write(f'<div>{html.escape(key)}</div>')
             h.write('</a></div>')
 
         h.write('</div>\n')
-        # JS: intersection observer for animate-on-scroll and small parallax for top-hero
-        h.write("<script>\n(function(){var io=new IntersectionObserver(function(entries){entries.forEach(function(e){if(e.isIntersecting){e.target.classList.add('visible');io.unobserve(e.target);}});},{threshold:0.12});document.querySelectorAll('.animate-on-scroll').forEach(function(el){io.observe(el)});var topHero=document.querySelector('.top-hero');if(topHero){var imgs=topHero.querySelectorAll(\"img\");window.addEventListener('scroll',function(){var rect=topHero.getBoundingClientRect();var h=window.innerHeight;var pct=1-Math.max(0,Math.min(1,(rect.top+h)/(h+rect.height)));imgs.forEach(function(img,i){var offset=(pct-0.5)*(i%2?6:-6);img.style.transform='translateY('+offset+'px)';});},{passive:true});} })();\n</script>\n")
+        h.write(f'<script src="{asset_url("js")}" defer></script>\n')
         h.write('</body>\n</html>')
+        page = h.getvalue()
+        page = page_head('Portfolio', hero_preload(hero['variants']) if hero else '', fold=page[:fold]) + page
+        changed = write_text_if_changed(index_out, minify_html(page) if MINIFY else page)
+
+    print('Index written:' if changed else 'Index unchanged:', index_out)
+
+
+def _seed_tag(orientation=1):
+    """Short hash of the preview settings, part of every preview file name."""
+    key = json.dumps([SEED_MAX_DIM, SEED_QUALITY] + ([orientation] if orientation != 1 else []))
+    return hashlib.sha1(key.encode('ascii')).hexdigest()[:8]
+
+
+def _seed_preview(src_rel, decode_rel, sha1=None, orientation=1):
+    """Make sure the seed preview of a source exists: a SEED_MAX_DIM WebP (JPEG
+    if WebP is unavailable) decoded from `decode_rel` (its thumbnail when there
+    is one) and stored under the source's content hash, so identical files share
+    one preview. `orientation` turns a decoded original upright (thumbnails
+    already are). Returns {'sha1', 'preview'}."""
+    if sha1 is None:
+        sha1 = _file_sha1(Path(d) / src_rel)
+    base = Path(imgdir) / THUMB_DIRNAME / SEED_DIRNAME / f'{sha1}-{_seed_tag(orientation)}'
+    for ext in ('.webp', '.jpg'):
+        if base.with_suffix(ext).exists():
+            return {'sha1': sha1, 'preview': os.path.relpath(base.with_suffix(ext), d).replace('\\', '/')}
+    base.parent.mkdir(parents=True, exist_ok=True)
+    box = (SEED_MAX_DIM, SEED_MAX_DIM)
+    with open_scaled(Path(d) / decode_rel, box, orientation=orientation if decode_rel == src_rel else 1) as im:
+        resample = getattr(Image, 'Resampling', Image).LANCZOS
+        im.thumbnail(box, resample=resample, reducing_gap=None)
+        im = im.convert('RGBA' if im.mode in ('RGBA', 'LA') or 'transparency' in im.info else 'RGB')
+        try:
+            data = _encode(im, 'WEBP', {'quality': SEED_QUALITY, 'method': 6})
+            path = base.with_suffix('.webp')
+        except Exception:
+            data = _encode(im.convert('RGB'), 'JPEG', {'quality': SEED_QUALITY, 'optimize': True})
+            path = base.with_suffix('.jpg')
+    tmp = path.with_name(f'{path.name}.tmp{os.getpid()}')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return {'sha1': sha1, 'preview': os.path.relpath(path, d).replace('\\', '/')}
+
 
-    print('Index written:', index_out)
+def seed_previews(srcs, ex=None, room=None):
+    """Seed entries for srcs ({src: manifest entry with the 'preview' path}),
+    from the manifest when the source stamp is unchanged; the missing ones are
+    made on `ex` if given. An entry kept without its preview (only its 'size',
+    see write_localstorage_seed()) is not remade while that size exceeds `room`
+    less the known sizes of the entries before it; the srcs after it are skipped."""
+    seed = _manifest.setdefault('seed', {})
+    out, jobs = {}, {}
+    for src in srcs:
+        try:
+            stamp = source_stamp(src)
+        except Exception:
+            continue
+        entry = seed.get(src)
+        sha1 = entry['sha1'] if entry and entry.get('stamp') == stamp else None
+        tag = _seed_tag(orientation_of(src))
+        if sha1 and entry.get('tag') == tag and 'preview' not in entry \
+                and room is not None and _seed_item_bytes(entry.get('size', 0)) > room:
+            gallery_profile.count('seed.hit')
+            out[src] = entry
+            break
+        if sha1 and entry.get('tag') == tag and 'preview' in entry and (Path(d) / entry['preview']).exists():
+            gallery_profile.count('seed.hit')
+            out[src] = entry
+            if room is not None and 'size' in entry:
+                room -= _seed_item_bytes(entry['size'])
+            continue
+        gallery_profile.count('seed.miss')
+        jobs[src] = (stamp, tag, (src, lookup_thumb(src), sha1, orientation_of(src)))
+    futures = {src: ex.submit(_seed_preview, *a) for src, (_, _, a) in jobs.items()} if ex else {}
+    for src, (stamp, tag, a) in jobs.items():
+        try:
+            res = futures[src].result() if src in futures else _seed_preview(*a)
+        except Exception:
+            try:
+                res = _seed_preview(*a)
+            except Exception as e:
+                print('Seed preview failed for', src, e)
+                continue
+        seed[src] = out[src] = {'stamp': stamp, 'tag': tag, **res}
+    return out
 
 
-def write_localstorage_seed(groups, outname='localstorage_seed.json', limit=24):
+def _data_url(rel):
+    mime = 'image/webp' if rel.endswith('.webp') else 'image/jpeg'
+    with open(Path(d) / rel, 'rb') as f:
+        return f'data:{mime};base64,' + base64.b64encode(f.read()).decode('ascii')
+
+
+def _seed_item_bytes(size, first=False):
+    """Bytes a seed item whose compact JSON is `size` long adds to the file as
+    site_json() writes it (indentation, and the separator unless it is first)."""
+    blank = {'dataUrl': '', 'title': '', 'desc': ''}
+    compact = len(json.dumps(blank, separators=(',', ':')))
+    if first:
+        return size + len(site_json([blank])) - len(site_json([])) - compact
+    return size + len(site_json([blank, blank])) - len(site_json([blank])) - compact
+
+
+def write_localstorage_seed(groups, outname=SEED_NAME, budget=None, jobs=None):
     """Génère un fichier JSON contenant une liste d'objets {dataUrl,title,desc}
-    pour préremplir le localStorage via l'interface. Préfère les vignettes si présentes."""
-    items = []
+    pour préremplir le localStorage via l'interface. Each dataUrl is an inline
+    data: URL of a small preview; entries are added in group order until the
+    first one that would take the stored JSON over `budget` bytes (SEED_BUDGET),
+    so the page can show them offline without a single request. Only the
+    previews of added entries are made and kept."""
+    if budget is None:
+        budget = SEED_BUDGET
     # iterate groups in deterministic (alphabetical) order
-    keys = sorted(groups.keys())
-
-    for k in keys:
-        for src in groups[k]:
-            thumb = ensure_thumb(src)
-            dataUrl = thumb if thumb and thumb != src else src
-            items.append({'dataUrl': dataUrl, 'title': '', 'desc': ''})
-            if len(items) >= limit:
-                break
-        if len(items) >= limit:
-            break
+    candidates = list(dict.fromkeys(canonical(src) for k in sorted(groups) for src in groups[k]))
+    items = []
+    used = len(site_json(items))
+    if PIL_AVAILABLE:
+        if jobs is None:
+            jobs = JOBS
+        if jobs <= 0:
+            jobs = os.cpu_count() or 1
+        added, full = set(), False
+        ex = None
+        try:
+            if jobs > 1:
+                ex = ProcessPoolExecutor(max_workers=jobs, initializer=_thumb_worker_init,
+                                         initargs=_worker_args())
+            pos = 0
+            # previews are made batch by batch (sized from the average entry),
+            # stopping at the first one that does not fit
+            while pos < len(candidates) and not full and budget - used > SEED_MIN_ENTRY:
+                if items:
+                    n = math.ceil((budget - used) / ((used - len(site_json([]))) / len(items)))
+                    batch = min(max(n, 1), jobs * 4)
+                else:
+                    batch = jobs
+                chunk = candidates[pos:pos + batch]
+                pos += batch
+                entries = seed_previews(chunk, ex, room=budget - used)
+                for src in chunk:
+                    entry = entries.get(src)
+                    if entry is None:
+                        continue
+                    item = None
+                    if 'preview' in entry:
+                        item = {'dataUrl': _data_url(entry['preview']), 'title': '', 'desc': ''}
+                        entry['size'] = len(json.dumps(item, separators=(',', ':')))
+                    size = _seed_item_bytes(entry['size'], first=not items)
+                    if item is None or used + size > budget:
+                        # remember its size (not its preview) so the next build stops here too
+                        entry.pop('preview', None)
+                        added.add(src)
+                        full = True
+                        break
+                    items.append(item)
+                    added.add(src)
+                    used += size
+        finally:
+            if ex is not None:
+                ex.shutdown()
+        # forget the previews that are not in the seed and delete their files
+        seed = _manifest.get('seed', {})
+        for src in [s for s in seed if s not in added]:
+            del seed[src]
+        live = {e['preview'] for e in seed.values() if 'preview' in e}
+        seed_dir = Path(imgdir) / THUMB_DIRNAME / SEED_DIRNAME
+        for path in seed_dir.iterdir() if seed_dir.is_dir() else []:
+            if os.path.relpath(path, d).replace('\\', '/') not in live:
+                path.unlink()
 
-    outpath = os.path.join(d, outname)
+    outpath = os.path.join(site_dir, outname)
+    text = site_json(items)
+    if len(text.encode('utf-8')) > budget and items:
+        print(f'Seed is {len(text.encode("utf-8"))} bytes, over its {budget} byte budget')
     try:
-        with open(outpath, 'w', encoding='utf-8') as f:
-            json.dump(items, f, ensure_ascii=False, indent=2)
-        print(f'Wrote {len(items)} entries to {outpath}')
+        if write_text_if_changed(outpath, text):
+            print(f'Wrote {len(items)} entries ({used / 1024:.0f} kB) to {outpath}')
     except Exception as e:
         print('Failed to write seed:', e)
 
 
-if __name__ == '__main__':
-    groups = collect_groups()
+def affected_groups(groups, changed):
+    """Groups whose page depends on one of the changed project-relative paths
+    (a file in, or the folder of, the group). None means every group."""
+    if changed is None:
+        return set(groups)
+    touched = set(changed) | {os.path.dirname(p) for p in changed}
+    return {key for key in groups if os.path.join('images', *key.split('/')) in touched}
+
+
+def encoder_report(groups):
+    """Print, per group, the bytes of the SSIM-searched derivatives and the
+    (estimated) bytes saved against the fixed JPEG_SAVE/WEBP_SAVE encode (read
+    from the manifest, so warm builds report too)."""
+    sources = _manifest.get('sources', {})
+    total = total_saved = 0
+    for key in sorted(groups):
+        size = saved = 0
+        for src in set(groups[key]):
+            for v in (sources.get(src) or {}).get('variants', []):
+                size += v.get('bytes', 0)
+                saved += v.get('saved', 0)
+        if size:
+            print(f'Encoder: {key}: {size / 1024:.0f} kB, saved {saved / 1024:.0f} kB '
+                  f'({100 * saved / (size + saved):.0f}%)')
+        total += size
+        total_saved += saved
+    if total:
+        print(f'Encoder: total {total / 1024:.0f} kB, saved {total_saved / 1024:.0f} kB '
+              f'({100 * total_saved / (total + total_saved):.0f}%)')
+
+
+def build(args, changed=None, backup=True):
+    """Run one build. With `changed` (paths relative to the project root), only
+    the thumbnails and pages of the groups they touch are regenerated; the
+    index and seed are always refreshed (and only written if they differ).
+    With --out, the pages, JSON and assets are written into a new release
+    staged from the current one (gallery_publish.stage()), which is published
+    at the end or deleted if the build fails; the derivatives stay cached in
+    images/.thumbs and are linked into it."""
+    global site_dir
+    release = gallery_publish.stage(args.out) if args.out else None
+    site_dir = release or d
+    try:
+        _build(args, changed, backup, release)
+    finally:
+        site_dir = d
+        current = gallery_publish.current_release(args.out) if release else None
+        if release and not (current and os.path.samefile(current, release)):
+            shutil.rmtree(release, ignore_errors=True)
+
+
+def _build(args, changed, backup, release):
+    _thumbs.clear()
+    _digests.clear()
+    gallery_profile.reset()
+    with gallery_profile.stage('manifest.load'):
+        load_manifest()
+    with gallery_profile.stage('scan'):
+        scan_library(use_cache=args.scan_cache)
+        groups = collect_groups()
     if not groups:
         print('No images found in', imgdir)
-    else:
+        return
+    if PIL_AVAILABLE:
+        with gallery_profile.stage('catalog'):
+            load_catalog(jobs=args.jobs)
+    if ORDER == 'date':
+        groups = {k: gallery_catalog.by_date(v, _catalog) for k, v in groups.items()}
+    with gallery_profile.stage('assets'):
+        build_assets()
+    pages = affected_groups(groups, changed)
+    srcs = plan_thumbs({k: groups[k] for k in pages}) + [group_cover(k, v) for k, v in groups.items()]
+    _canonical.clear()
+    if DEDUP:
+        with gallery_profile.stage('dedup'):
+            find_duplicates([s for imgs in groups.values() for s in imgs] + srcs, jobs=args.jobs)
+    with gallery_profile.stage('thumbs'):
+        generate_thumbs(srcs, jobs=args.jobs)
+    with gallery_profile.stage('probe'):
+        probe_images(srcs + collect_profile()['images'][:2], jobs=args.jobs)
+    prune_manifest(srcs)
+    if ENCODER == 'ssim' and USE_THUMBS:
+        encoder_report({k: groups[k] for k in pages})
+    with gallery_profile.stage('group_pages'):
+        for key in sorted(pages):
+            write_group_page(key, groups[key])
+    # after the thumbnail and probe pools: no thread is streaming a video while they fork
+    try:
+        with gallery_profile.stage('videos'):
+            prepare_videos(collect_profile()['videos'][:1])
+    except Exception as e:
+        print('Could not prepare the profile video:', e)
+    with gallery_profile.stage('index'):
         write_index(groups)
+    try:
+        with gallery_profile.stage('seed'):
+            write_localstorage_seed(groups, budget=args.seed_kb * 1024, jobs=args.jobs)
+    except Exception as e:
+        print('Could not write localstorage seed:', e)
+    with gallery_profile.stage('precompress'):
+        if PRECOMPRESS:
+            precompress(jobs=args.jobs)
+        prune_compressed()
+    with gallery_profile.stage('manifest.save'):
+        save_manifest()
+    if args.out:
+        with gallery_profile.stage('publish'):
+            gallery_publish.publish(d, site_images(groups), args.out, release=release,
+                                    generated=site_files())
+    if backup:
+        # incremental, deduplicated backup of the project in Backup/store
         try:
-            write_localstorage_seed(groups)
+            with gallery_profile.stage('backup'):
+                gallery_backup.snapshot(d)
+                gallery_backup.prune(d)
         except Exception as e:
-            print('Could not write localstorage seed:', e)
-        # create a project-local Backup folder and store a timestamped ZIP inside it
-        try:
-            def create_project_backup():
-                backup_dir = os.path.join(d, 'Backup')
-                os.makedirs(backup_dir, exist_ok=True)
-                ts = datetime.datetime.now().strftime('%Y-%m-%d_%H%M%S')
-                dest = os.path.join(backup_dir, f'MonSitePhotos_backup_{ts}.zip')
-                # use zip to avoid including the backup file itself; exclude common unwanted folders
-                cmd = [
-                    'zip', '-r', dest, '.',
-                    '-x', 'Backup/*', '*.DS_Store', '__pycache__/*', '.venv/*', 'venv/*', '*.zip'
-                ]
-                try:
-                    subprocess.check_call(cmd, cwd=d)
-                    print('Project backup created:', dest)
-                except Exception as e:
-                    # fallback to shutil.make_archive if zip is not available
-                    try:
-                        base = os.path.join(backup_dir, f'MonSitePhotos_backup_{ts}')
-                        shutil.make_archive(base, 'zip', root_dir=d)
-                        print('Project backup created (shutil):', base + '.zip')
-                    except Exception as e2:
-                        print('Failed to create project backup:', e, e2)
+            print('Failed to create project backup:', e)
+    if args.profile:
+        gallery_profile.write(args.profile)
 
-        except Exception:
-            pass
-        try:
-            create_project_backup()
-        except Exception:
-            pass
 
+def settings_parser(description):
+    """Argument parser of the settings that shape the generated files, shared
+    with generate_localstorage_seed.py so both tools make the same derivatives
+    (see apply_settings())."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--root', default=d,
+                        help='project folder holding images/ (default: %(default)s)')
+    parser.add_argument('--jobs', '-j', type=int, default=JOBS,
+                        help='worker processes for thumbnails (0 = one per CPU, 1 = serial)')
+    parser.add_argument('--thumbs', action='store_true', default=USE_THUMBS,
+                        help='generate thumbnails instead of using the original images')
+    parser.add_argument('--widths', default=','.join(str(w) for w in THUMB_WIDTHS),
+                        help='comma-separated srcset widths generated below the thumbnail size')
+    parser.add_argument('--encoder', choices=('max', 'ssim'), default=ENCODER,
+                        help='fixed maximum quality, or the lowest quality meeting --ssim per derivative')
+    parser.add_argument('--ssim', type=float, default=TARGET_SSIM,
+                        help='SSIM target of --encoder ssim (default %(default)s)')
+    parser.add_argument('--memory-mb', type=int, default=MEMORY_BUDGET_MB,
+                        help='peak decode memory shared by the thumbnail workers (0 = no limit)')
+    parser.add_argument('--scan-cache', action='store_true',
+                        help='reuse the saved listing of directories whose mtime did not change '
+                             '(photos edited in place are then not noticed)')
+    parser.add_argument('--group-mode', choices=('single', 'paged', 'virtual'), default=GROUP_MODE,
+                        help='one page per group, paginated pages, or a virtualized page')
+    parser.add_argument('--page-size', type=int, default=GROUP_PAGE_SIZE,
+                        help='images per page in paged mode')
+    parser.add_argument('--lqip', action='store_true', default=LQIP,
+                        help='embed a tiny blurred placeholder behind every image')
+    parser.add_argument('--seed-kb', type=int, default=SEED_BUDGET // 1024,
+                        help='size budget of localstorage_seed.json in kB (default %(default)s)')
+    parser.add_argument('--dedup', action='store_true', default=DEDUP,
+                        help='give byte-identical photos one set of derivatives and one URL, '
+                             'and list near duplicates in images/.thumbs/duplicates.json')
+    parser.add_argument('--order', choices=('name', 'date'), default=ORDER,
+                        help='order of the photos in a group: file name or EXIF capture date')
+    parser.add_argument('--hash', action='store_true', default=HASH_SOURCES,
+                        help='also compare source content hashes, not only size/mtime')
+    parser.add_argument('--minify', action='store_true', default=MINIFY,
+                        help='minify the generated HTML and JSON')
+    parser.add_argument('--no-critical-css', dest='critical_css', action='store_false', default=CRITICAL_CSS,
+                        help='link the stylesheet normally instead of inlining the rules the top of each page needs')
+    parser.add_argument('--precompress', action='store_true', default=PRECOMPRESS,
+                        help='write .gz (and .br with a Brotli module) next to pages, JSON and assets')
+    return parser
+
+
+def apply_settings(args):
+    """Set the module settings from arguments parsed by settings_parser()."""
+    global USE_THUMBS, HASH_SOURCES, MEMORY_BUDGET_MB, GROUP_MODE, GROUP_PAGE_SIZE, LQIP, THUMB_WIDTHS
+    global ENCODER, TARGET_SSIM, MINIFY, PRECOMPRESS, CRITICAL_CSS, DEDUP, ORDER, d, imgdir, site_dir
+    d = os.path.abspath(os.path.expanduser(args.root))
+    imgdir = os.path.join(d, 'images')
+    site_dir = d
+    USE_THUMBS = args.thumbs
+    HASH_SOURCES = args.hash
+    MEMORY_BUDGET_MB = args.memory_mb
+    GROUP_MODE = args.group_mode
+    GROUP_PAGE_SIZE = args.page_size
+    LQIP = args.lqip
+    THUMB_WIDTHS = tuple(int(w) for w in args.widths.split(',') if w.strip())
+    ENCODER = args.encoder
+    MINIFY = args.minify
+    CRITICAL_CSS = args.critical_css
+    DEDUP = args.dedup
+    ORDER = args.order
+    PRECOMPRESS = args.precompress
+    TARGET_SSIM = args.ssim
+    if ENCODER == 'ssim' and not NUMPY_AVAILABLE:
+        print('NumPy is not installed: --encoder ssim falls back to fixed quality')
+        ENCODER = 'max'
+
+
+def main(argv=None):
+    parser = settings_parser('Generate the gallery pages from images/.')
+    parser.add_argument('--profile', nargs='?', const='build-profile.json', metavar='FILE',
+                        help='write a JSON report of the build: time per stage and per image, '
+                             'bytes, cache hits, peak memory (default file: %(const)s)')
+    parser.add_argument('--pstats', metavar='FILE',
+                        help='also run the build under cProfile and save the stats to FILE '
+                             '(main process only)')
+    parser.add_argument('--out', metavar='DIR',
+                        help='write the site into a new release, images hardlinked from the project, '
+                             'and swap the symlink DIR to it atomically')
+    parser.add_argument('--no-backup', action='store_true',
+                        help='do not take a backup snapshot after the build')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and rebuild what changed in images/')
+    parser.add_argument('--serve', type=int, nargs='?', const=8000, metavar='PORT',
+                        help='serve the site locally (default port 8000)')
+    args = parser.parse_args(argv)
+    if args.out:
+        args.out = os.path.abspath(os.path.expanduser(args.out))
+        if os.path.exists(args.out) and not os.path.islink(args.out):
+            parser.error('--out must be a new name or a symlink made by --out')
+    apply_settings(args)
+
+    if args.pstats:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.runcall(build, args, backup=not (args.watch or args.no_backup))
+        profiler.dump_stats(args.pstats)
+        print('cProfile stats written:', args.pstats)
+    else:
+        build(args, backup=not (args.watch or args.no_backup))
+    if args.serve is not None:
+        gallery_serve.start_server(args.out or d, args.serve)
+    try:
+        if args.watch:
+            for changed in gallery_serve.watch(d, 'images', skip=(THUMB_DIRNAME,)):
+                print('Changed:', ', '.join(sorted(changed)[:5]) + (' …' if len(changed) > 5 else ''))
+                build(args, changed, backup=False)
+        elif args.serve is not None:
+            while True:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,43 +1,44 @@
 #!/usr/bin/env python3
 """
-Génère un fichier `localstorage_seed.json` contenant une liste d'images
-(relative URLs) à utiliser pour préremplir le localStorage via l'interface.
-Par défaut cherche d'abord dans `images/.thumbs/` puis dans `images/`.
+Génère `localstorage_seed.json` sans reconstruire tout le site : une liste
+d'images {dataUrl,title,desc} à utiliser pour préremplir le localStorage via
+l'interface. C'est la même étape que celle de `generate_gallery.py`
+(write_localstorage_seed) : les dataUrl sont de vraies URL `data:` de petits
+aperçus, mis en cache par empreinte du fichier source, ajoutés tant que le
+JSON reste sous le budget (--seed-kb, ou --kb). Il accepte les options de
+`generate_gallery.py` qui décident des fichiers générés (--thumbs, --widths,
+--encoder, --minify, --dedup, --order…) : passer les mêmes que pour la
+génération complète, sinon les vignettes refaites ici et le seed diffèrent
+des siens.
+
+Usage :
+    python generate_localstorage_seed.py [--root DOSSIER] [--kb 4096] [-j N]
+                                         [--thumbs --widths 320,640 --minify …]
 """
 import os
-import json
-
-ROOT = os.path.dirname(__file__)
-IMAGES_DIR = os.path.join(ROOT, 'images')
-THUMBS_DIR = os.path.join(IMAGES_DIR, '.thumbs')
-OUT = os.path.join(ROOT, 'localstorage_seed.json')
-
-EXTS = ('.jpg', '.jpeg', '.png', '.webp')
-
-items = []
-
-# prefer thumbs if available
-if os.path.isdir(THUMBS_DIR):
-    for dirpath, dirnames, filenames in os.walk(THUMBS_DIR):
-        for fn in filenames:
-            if fn.lower().endswith(EXTS):
-                rel = os.path.relpath(os.path.join(dirpath, fn), ROOT).replace('\\', '/')
-                items.append({'dataUrl': rel, 'title': '', 'desc': ''})
-# fallback to images/
-if not items and os.path.isdir(IMAGES_DIR):
-    for dirpath, dirnames, filenames in os.walk(IMAGES_DIR):
-        # skip .thumbs if present
-        if os.path.basename(dirpath) == '.thumbs':
-            continue
-        for fn in filenames:
-            if fn.lower().endswith(EXTS):
-                rel = os.path.relpath(os.path.join(dirpath, fn), ROOT).replace('\\', '/')
-                items.append({'dataUrl': rel, 'title': '', 'desc': ''})
 
-# limit to 24 images for performance
-items = items[:24]
+import generate_gallery as gg
 
-with open(OUT, 'w', encoding='utf-8') as f:
-    json.dump(items, f, ensure_ascii=False, indent=2)
+if __name__ == '__main__':
+    # the build's own options: a preview made here decodes the thumbnail the
+    # build would make (same widths, encoder, minification...) and not another
+    parser = gg.settings_parser('Write localstorage_seed.json with inline previews.')
+    parser.add_argument('--kb', dest='seed_kb', type=int,
+                        help='same as --seed-kb')
+    parser.set_defaults(root=os.path.dirname(os.path.abspath(__file__)))
+    args = parser.parse_args()
+    gg.apply_settings(args)
 
-print(f'Wrote {len(items)} entries to {OUT}')
+    gg.load_manifest()
+    gg.scan_library(use_cache=args.scan_cache)
+    groups = gg.collect_groups()
+    # the same steps as build(): the EXIF orientation (part of the preview
+    # tag), the capture-date order and the canonical copy of duplicates
+    if gg.PIL_AVAILABLE:
+        gg.load_catalog(jobs=args.jobs)
+    if gg.ORDER == 'date':
+        groups = {k: gg.gallery_catalog.by_date(v, gg._catalog) for k, v in groups.items()}
+    if gg.DEDUP:
+        gg.find_duplicates([s for imgs in groups.values() for s in imgs], jobs=args.jobs)
+    gg.write_localstorage_seed(groups, budget=args.seed_kb * 1024, jobs=args.jobs)
+    gg.save_manifest()